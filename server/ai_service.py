@@ -1,21 +1,17 @@
 import os
 import logging
-from typing import List, AsyncGenerator, Optional
+from typing import List, AsyncGenerator, Optional, Union
 import fitz  # PyMuPDF
 from openai import AsyncOpenAI
 import asyncio
 from io import BytesIO
-import requests
 import uuid
-import urllib3
 import base64
+import ssl
 import time
 from dataclasses import dataclass
 import httpx
 
-# Disable SSL warnings for GigaChat API
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -29,6 +25,11 @@ class TokenInfo:
         """Check if token is expired (with 5 minute buffer)"""
         current_time = int(time.time())
         return current_time >= (self.expires_at - 300)  # 5 minute buffer
+    
+    def needs_refresh(self) -> bool:
+        """Check if token is close enough to expiry to renew it in the background (10 minutes)"""
+        current_time = int(time.time())
+        return current_time >= (self.expires_at - 600)
 
 class AIService:
     def __init__(self):
@@ -37,12 +38,44 @@ class AIService:
         
         # Token caching for GigaChat
         self._cached_token: Optional[TokenInfo] = None
+        # Token the current GigaChat client was built with
+        self._client_token: Optional[str] = None
+        # Background renewal of a token that is about to expire
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Single flight: concurrent callers wait for one OAuth request instead of each sending one
+        self._token_lock = asyncio.Lock()
+        
+        # One keep-alive HTTP/2 connection pool for all API calls instead of a new TLS
+        # handshake per chat request
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            verify=self._tls_verify(),
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+        # Document downloads go to storage, which is verified like any other host
+        self.download_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_keepalive_connections=8)
+        )
         
         if self.provider == "gigachat":
             self._init_gigachat()
         else:
             self._init_deepseek()
     
+    def _tls_verify(self) -> Union[bool, ssl.SSLContext]:
+        """TLS verification for the AI API client.
+        GigaChat's certificates chain to a root CA missing from the default store: verify against
+        GIGACHAT_CA_BUNDLE when it is set (one SSL context, loaded once), otherwise skip verification."""
+        if self.provider != "gigachat":
+            return True
+        ca_bundle = os.getenv("GIGACHAT_CA_BUNDLE")
+        if not ca_bundle:
+            return False
+        return ssl.create_default_context(cafile=ca_bundle)
+    
     def _init_deepseek(self):
         """Initialize DeepSeek client"""
         api_key = os.getenv("DEEPSEEK_API_KEY")
@@ -53,7 +86,8 @@ class AIService:
             
         self.client = AsyncOpenAI(
             api_key=api_key,
-            base_url=os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com")
+            base_url=os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com"),
+            http_client=self.http_client
         )
         self.model_name = "deepseek-chat"
     
@@ -68,9 +102,32 @@ class AIService:
         # Check if we have a valid cached token
         if self._cached_token and not self._cached_token.is_expired():
             logger.debug("Using cached GigaChat token")
+            # Renew ahead of expiry so no chat request has to wait for the OAuth round trip
+            if self._cached_token.needs_refresh() and self._refresh_task is None:
+                self._refresh_task = asyncio.create_task(self._refresh_token_in_background())
             return self._cached_token.access_token
         
-        # Get new token
+        async with self._token_lock:
+            # Another caller may have fetched a token while this one waited
+            if self._cached_token and not self._cached_token.is_expired():
+                return self._cached_token.access_token
+            return await self._request_gigachat_token()
+    
+    async def _refresh_token_in_background(self):
+        """Fetch a fresh token while the current one is still valid"""
+        try:
+            async with self._token_lock:
+                if self._cached_token and not self._cached_token.needs_refresh():
+                    return
+                await self._request_gigachat_token()
+        except Exception as e:
+            # The current token stays in use; the next request after expiry fetches synchronously
+            logger.warning(f"Background GigaChat token refresh failed: {e}")
+        finally:
+            self._refresh_task = None
+    
+    async def _request_gigachat_token(self) -> str:
+        """Request a new GigaChat access token and cache it"""
         logger.info("Requesting new GigaChat access token")
         auth_key = os.getenv("GIGACHAT_AUTH_KEY")
         if not auth_key:
@@ -86,9 +143,10 @@ class AIService:
         }
         
         try:
-            response = requests.post(url, data=payload, headers=headers, verify=False)
+            # Through the shared async client: a blocking request here would stall the event loop
+            response = await self.http_client.post(url, content=payload, headers=headers)
             
-            if not response.ok:
+            if not response.is_success:
                 logger.error(f"GigaChat token request failed: {response.status_code} - {response.text}")
                 raise Exception(f"GigaChat API returned {response.status_code}: {response.text}")
             
@@ -97,6 +155,9 @@ class AIService:
             token_data = response.json()
             access_token = token_data["access_token"]
             expires_at = token_data.get("expires_at", int(time.time()) + 1800)  # Default 30 min
+            # GigaChat reports expires_at in milliseconds; TokenInfo works in seconds
+            if expires_at > 10**11:
+                expires_at //= 1000
             
             # Cache the token
             self._cached_token = TokenInfo(
@@ -108,10 +169,33 @@ class AIService:
             logger.info(f"GigaChat token obtained successfully, expires at {expires_at}")
             return access_token
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Failed to get GigaChat token: {e}")
             raise Exception(f"Failed to get GigaChat access token: {e}")
     
+    async def _ensure_gigachat_client(self):
+        """(Re)build the GigaChat client when the access token changes, on the shared HTTP client"""
+        access_token = await self.get_gigachat_token()
+        if self.client is not None and self._client_token == access_token:
+            return
+        
+        # Use the correct GigaChat API endpoint
+        api_base = os.getenv("GIGACHAT_API_BASE", "https://gigachat.devices.sberbank.ru/api/v1")
+        self.client = AsyncOpenAI(
+            api_key=access_token,
+            base_url=api_base,
+            http_client=self.http_client
+        )
+        self._client_token = access_token
+        logger.info("GigaChat client initialized successfully")
+    
+    async def aclose(self):
+        """Close the shared HTTP connection pools (on application shutdown)"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        await self.http_client.aclose()
+        await self.download_client.aclose()
+    
     def clear_token_cache(self):
         """Clear cached token (useful for testing or forced refresh)"""
         self._cached_token = None
@@ -123,11 +207,9 @@ class AIService:
     
     async def extract_text_from_pdf(self, pdf_url: str, page_numbers: List[int]) -> str:
         try:
-            import httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.get(pdf_url)
-                response.raise_for_status()
-                pdf_data = BytesIO(response.content)
+            response = await self.download_client.get(pdf_url)
+            response.raise_for_status()
+            pdf_data = BytesIO(response.content)
             
             doc = fitz.open(stream=pdf_data, filetype="pdf")
             text_parts = []
@@ -189,20 +271,7 @@ You do not have access to any PDF document context. Answer questions to the best
             # Initialize client for GigaChat if needed
             if self.provider == "gigachat":
                 try:
-                    access_token = await self.get_gigachat_token()
-                    # Use the correct GigaChat API endpoint
-                    api_base = os.getenv("GIGACHAT_API_BASE", "https://gigachat.devices.sberbank.ru/api/v1")
-                    
-                    self.client = AsyncOpenAI(
-                        api_key=access_token,
-                        base_url=api_base,
-                        http_client=httpx.AsyncClient(
-                            verify=False,  # Disable SSL verification for GigaChat
-                            timeout=httpx.Timeout(30.0)  # 30 second timeout
-                        )
-                    )
-                    
-                    logger.info("GigaChat client initialized successfully")
+                    await self._ensure_gigachat_client()
                 except Exception as token_error:
                     logger.error(f"Failed to get GigaChat token: {token_error}")
                     yield f"❌ **GigaChat Error**: Failed to get access token. Please check your GIGACHAT_AUTH_KEY."
@@ -312,20 +381,7 @@ Instructions:
             # Initialize client for GigaChat if needed
             if self.provider == "gigachat":
                 try:
-                    access_token = await self.get_gigachat_token()
-                    # Use the correct GigaChat API endpoint
-                    api_base = os.getenv("GIGACHAT_API_BASE", "https://gigachat.devices.sberbank.ru/api/v1")
-                    
-                    self.client = AsyncOpenAI(
-                        api_key=access_token,
-                        base_url=api_base,
-                        http_client=httpx.AsyncClient(
-                            verify=False,  # Disable SSL verification for GigaChat
-                            timeout=httpx.Timeout(30.0)  # 30 second timeout
-                        )
-                    )
-                    
-                    logger.info("GigaChat client initialized successfully")
+                    await self._ensure_gigachat_client()
                 except Exception as token_error:
                     logger.error(f"Failed to get GigaChat token: {token_error}")
                     yield f"❌ **GigaChat Error**: Failed to get access token. Please check your GIGACHAT_AUTH_KEY."
@@ -79,6 +79,9 @@ class MockAIService:
         self.context_pages = int(os.getenv("CHAT_CONTEXT_PAGES", "2"))
         logger.info("🔧 Mock AI Service initialized (для тестирования)")
     
+    async def aclose(self):
+        """Совместимость с AIService: внешних соединений нет, закрывать нечего"""
+    
     async def extract_text_from_pdf(self, pdf_url: str, page_numbers: List[int]) -> str:
         try:
             import httpx
@@ -1,7 +1,9 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import os
-from typing import Generator
+from typing import Generator, AsyncGenerator
 from supabase import create_client, Client
 import traceback
 # Database configuration
@@ -10,7 +12,24 @@ password = os.getenv("DATABASE_PASSWORD", "postgres")
 dbname = os.getenv("DATABASE_NAME", "postgres")
 port = os.getenv("DATABASE_PORT", "54322")
 host = os.getenv("DATABASE_HOST", "127.0.0.1")
-DATABASE_URL = (f"postgresql+psycopg2://{username}:{password}@{host}:{port}/{dbname}{'' if os.getenv('NODE_ENV') == 'development' else '?sslmode=require'}")
+development = os.getenv('NODE_ENV') == 'development'
+# URL.create escapes special characters in the credentials and brackets IPv6 hosts
+DATABASE_URL = URL.create(
+    "postgresql+psycopg2",
+    username=username, password=password, host=host, port=int(port), database=dbname,
+    query={} if development else {"sslmode": "require"}
+)
+# asyncpg takes `ssl` instead of libpq's `sslmode`
+ASYNC_DATABASE_URL = URL.create(
+    "postgresql+asyncpg",
+    username=username, password=password, host=host, port=int(port), database=dbname,
+    query={} if development else {"ssl": "require"}
+)
+
+# Connection pool sizing (per engine, per worker process)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "25"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "25"))
+DATABASE_POOL_TIMEOUT = int(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
 
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -28,6 +47,9 @@ if SUPABASE_URL and SUPABASE_SERVICE_KEY:
 # Create engine with connection pooling
 engine = create_engine(
     DATABASE_URL,
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
+    pool_timeout=DATABASE_POOL_TIMEOUT,
     pool_pre_ping=True,
     pool_recycle=300,
     echo=False
@@ -36,6 +58,19 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the streaming chat endpoints so DB writes don't block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DATABASE_POOL_SIZE,
+    max_overflow=DATABASE_MAX_OVERFLOW,
+    pool_timeout=DATABASE_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    echo=False
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db() -> Generator:
     """Dependency to get database session"""
     db = SessionLocal()
@@ -44,6 +79,11 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependency to get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def test_database_connection() -> bool:
     """Test database connectivity"""
     try:
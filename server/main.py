@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import Session
 from typing import List, Optional, Literal
 from dataclasses import dataclass
@@ -9,37 +10,78 @@ import logging
 import json
 import asyncio
 import uuid
-from datetime import datetime
+from datetime import date, datetime
+from urllib.parse import quote
+import httpx
+import msgspec
 
-from database import get_db, test_database_connection, engine, supabase
+from database import (
+    get_db, test_database_connection, engine, supabase, AsyncSessionLocal,
+    SUPABASE_URL, SUPABASE_SERVICE_KEY
+)
 from auth import get_current_user_id
-from models import (
-    CreateDocumentRequest, DocumentResponse, Base, UpdateProgressRequest,
+from models import Document, ChatThread, ChatMessage, DocumentStructure, uuid7
+from schemas import (
+    CreateDocumentRequest, DocumentResponse, UpdateProgressRequest,
     CreateThreadRequest, ThreadResponse, CreateMessageRequest, MessageResponse,
-    ThreadWithMessagesResponse, Document, ChatThread, PageQuestionsResponse,
+    ThreadWithMessagesResponse, PageQuestionsResponse,
     AllDocumentQuestionsResponse, DocumentQuestionsMetadataResponse,
-    DocumentStructureResponse, ExtractStructureRequest,
+    DocumentStructureResponse, ExtractStructureRequest, ReindexStructureResponse,
     UserPlanResponse, UserUsageResponse, SetUserPlanRequest,
-    ShareDocumentRequest, ShareDocumentResponse, ShareStatusResponse
+    ShareDocumentRequest, ShareDocumentResponse, ShareStatusResponse, JSONResponseModel
 )
 from repository import (
-    create_document, list_documents, get_document_by_id, update_document_progress,
+    create_document, list_documents, get_document_by_id, list_documents_for_extraction,
+    update_document_progress,
     create_chat_thread, list_chat_threads, get_chat_thread_with_messages,
     create_chat_message, update_thread_title, get_page_questions,
     get_all_document_questions, get_document_questions_metadata,
     list_chat_threads_since, get_thread_messages_since,
-    save_document_structure, get_document_structure, get_chapter_by_page,
+    save_document_structure, get_document_structure, get_document_structure_json,
+    get_structure_items_by_checksum,
+    get_chapter_by_page, get_nearest_chapter,
     get_user_plan, set_user_plan, get_user_usage, increment_user_usage,
-    check_storage_limit, check_file_count_limit, check_single_file_limit,
-    check_tokens_limit, check_questions_limit,
+    usage_increment_statement, invalidate_user_usage,
+    check_upload_limits,
+    check_tokens_limit,
     create_document_share, get_document_share_by_token, revoke_document_share,
     get_active_document_share, record_share_access, get_document_by_id_or_share,
     check_user_has_document_access
 )
-from pdf_utils import extract_pdf_outline
+from pdf_utils import extract_pdf_outline, extract_many, shutdown_process_pool
 
 ContextTypeLiteral = Literal['page', 'chapter', 'none']
 
+# Headers for chat SSE responses (Content-Type comes from media_type)
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+}
+
+# Assistant replies still being saved. The event loop only keeps weak references to tasks,
+# and a save must outlive a client that disconnects before it finishes
+_persist_tasks: set[asyncio.Task] = set()
+
+
+def _persist_task_done(task: asyncio.Task) -> None:
+    _persist_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Failed to save assistant message", exc_info=task.exception())
+
+
+def start_persist_task(coro) -> asyncio.Task:
+    """Run an assistant-message save as a tracked task whose failure is always logged"""
+    task = asyncio.create_task(coro)
+    _persist_tasks.add(task)
+    task.add_done_callback(_persist_task_done)
+    return task
+
+
+def json_response(model: JSONResponseModel) -> Response:
+    """Return a pre-serialized model. FastAPI passes Response objects through untouched,
+    so response_model stays on the route for the OpenAPI schema only."""
+    return Response(content=model.to_json(), media_type="application/json")
+
 
 def normalize_context_type(value: Optional[str]) -> ContextTypeLiteral:
     if value in ("chapter", "section", "document"):
@@ -104,6 +146,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Shared HTTP client for Supabase storage calls (keep-alive + HTTP/2, no TLS handshake per request)
+@app.on_event("startup")
+async def startup_http_client():
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32),
+        timeout=httpx.Timeout(30.0)
+    )
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await app.state.http.aclose()
+
+@app.on_event("shutdown")
+async def shutdown_ai_client():
+    await ai_service.aclose()
+
+@app.on_event("shutdown")
+async def shutdown_pdf_workers():
+    shutdown_process_pool()
+
+@app.on_event("shutdown")
+async def drain_persist_tasks():
+    # Let in-flight assistant saves (and their usage increments) finish before exit
+    if _persist_tasks:
+        await asyncio.gather(*_persist_tasks, return_exceptions=True)
+
+async def create_signed_url(storage_key: str, expires_in: int = 3600) -> Optional[str]:
+    """Create a signed URL for a file in the 'pdfs' bucket via the Supabase Storage REST API"""
+    response = await app.state.http.post(
+        f"{SUPABASE_URL}/storage/v1/object/sign/pdfs/{quote(storage_key)}",
+        json={"expiresIn": expires_in},
+        headers={
+            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+            "apikey": SUPABASE_SERVICE_KEY
+        }
+    )
+    response.raise_for_status()
+    signed_path = response.json().get("signedURL")
+    if not signed_path:
+        return None
+    return f"{SUPABASE_URL}/storage/v1/{signed_path.lstrip('/')}"
+
 # Add logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -195,13 +280,6 @@ async def create_document_endpoint(
     db: Session = Depends(get_db)
 ):
     """Create a new document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Validate MIME type
     if request.mime != "application/pdf":
         raise HTTPException(
@@ -209,25 +287,8 @@ async def create_document_endpoint(
             detail="Only PDF files are allowed"
         )
     
-    # Check resource limits
-    # Check single file size limit
-    allowed, error_msg = check_single_file_limit(db, user_id, request.size_bytes)
-    if not allowed:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=error_msg
-        )
-    
-    # Check storage limit
-    allowed, error_msg = check_storage_limit(db, user_id, request.size_bytes)
-    if not allowed:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=error_msg
-        )
-    
-    # Check file count limit
-    allowed, error_msg = check_file_count_limit(db, user_id)
+    # Check resource limits (single file size, storage, file count) against one usage lookup
+    allowed, error_msg = check_upload_limits(db, user_id, request.size_bytes)
     if not allowed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -250,14 +311,10 @@ async def list_documents_endpoint(
     db: Session = Depends(get_db)
 ):
     """List user documents with pagination"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
-    return list_documents(db, user_id, limit, offset)
+    return Response(
+        content=msgspec.json.encode(list_documents(db, user_id, limit, offset)),
+        media_type="application/json"
+    )
 
 
 @app.delete("/api/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -267,13 +324,6 @@ async def delete_document_endpoint(
     db: Session = Depends(get_db)
 ):
     """Delete a document owned by the current user"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     document = get_document_by_id(db, document_id, user_id)
     if not document:
         raise HTTPException(
@@ -329,13 +379,6 @@ async def get_document_view_url(
     db: Session = Depends(get_db)
 ):
     """Get signed URL for viewing a document. Works for owned and shared documents."""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Get document and verify ownership or shared access
     document = get_document_by_id_or_share(db, document_id, user_id)
     if not document:
@@ -352,19 +395,16 @@ async def get_document_view_url(
                 detail="Supabase storage not available"
             )
             
-        signed_url_response = supabase.storage.from_('pdfs').create_signed_url(
-            document.storage_key,
-            expires_in=3600
-        )
+        signed_url = await create_signed_url(document.storage_key, expires_in=3600)
         
-        if not signed_url_response.get('signedURL'):
+        if not signed_url:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create signed URL"
             )
         
         return {
-            "url": signed_url_response['signedURL'],
+            "url": signed_url,
             "lastViewedPage": document.last_viewed_page or 1,
             "title": document.title
         }
@@ -382,13 +422,6 @@ async def update_view_progress(
     db: Session = Depends(get_db)
 ):
     """Update the last viewed page for a document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Validate page number
     if request.page < 1:
         raise HTTPException(
@@ -415,13 +448,6 @@ async def create_share_endpoint(
     db: Session = Depends(get_db)
 ):
     """Create a share link for a document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and belongs to user
     document = get_document_by_id(db, document_id, user_id)
     if not document:
@@ -475,13 +501,6 @@ async def get_share_status_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get share status for a document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and belongs to user
     document = get_document_by_id(db, document_id, user_id)
     if not document:
@@ -518,13 +537,6 @@ async def revoke_share_endpoint(
     db: Session = Depends(get_db)
 ):
     """Revoke a share link for a document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Revoke share
     success = revoke_document_share(db, document_id, user_id)
     if not success:
@@ -541,13 +553,6 @@ async def get_shared_document_info(
     db: Session = Depends(get_db)
 ):
     """Get document information by share token (no auth required)"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Get share
     share = get_document_share_by_token(db, share_token)
     if not share:
@@ -580,13 +585,6 @@ async def get_shared_document_access(
     db: Session = Depends(get_db)
 ):
     """Get access to a shared document (requires auth, records access)"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Get share
     share = get_document_share_by_token(db, share_token)
     if not share:
@@ -614,19 +612,16 @@ async def get_shared_document_access(
                 detail="Supabase storage not available"
             )
             
-        signed_url_response = supabase.storage.from_('pdfs').create_signed_url(
-            document.storage_key,
-            expires_in=3600
-        )
+        signed_url = await create_signed_url(document.storage_key, expires_in=3600)
         
-        if not signed_url_response.get('signedURL'):
+        if not signed_url:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create signed URL"
             )
         
         return {
-            "url": signed_url_response['signedURL'],
+            "url": signed_url,
             "lastViewedPage": document.last_viewed_page or 1,
             "title": document.title,
             "documentId": str(document.id)
@@ -646,13 +641,6 @@ async def create_chat_thread_endpoint(
     db: Session = Depends(get_db)
 ):
     """Create a new chat thread for a document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -681,13 +669,6 @@ async def list_chat_threads_endpoint(
     db: Session = Depends(get_db)
 ):
     """List chat threads for a document. Works for owned and shared documents. Optionally filter by updated_at timestamp."""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -706,7 +687,10 @@ async def list_chat_threads_endpoint(
                 detail="Invalid timestamp format. Use ISO 8601 format."
             )
     
-    return list_chat_threads_since(db, document_id, user_id, since_datetime)
+    return Response(
+        content=msgspec.json.encode(list_chat_threads_since(db, document_id, user_id, since_datetime)),
+        media_type="application/json"
+    )
 
 @app.get("/api/documents/{document_id}/pages/{page_number}/questions", response_model=PageQuestionsResponse)
 async def get_page_questions_endpoint(
@@ -716,13 +700,6 @@ async def get_page_questions_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get questions asked on a specific page of a document"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -730,7 +707,7 @@ async def get_page_questions_endpoint(
             detail="Document not found"
         )
     
-    return get_page_questions(db, document_id, page_number, user_id, limit=None)
+    return json_response(get_page_questions(db, document_id, page_number, user_id, limit=None))
 
 @app.get("/api/documents/{document_id}/questions/all", response_model=AllDocumentQuestionsResponse)
 async def get_all_document_questions_endpoint(
@@ -739,13 +716,6 @@ async def get_all_document_questions_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get all questions for a document, grouped by page"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -753,7 +723,7 @@ async def get_all_document_questions_endpoint(
             detail="Document not found"
         )
     
-    return get_all_document_questions(db, document_id, user_id)
+    return json_response(get_all_document_questions(db, document_id, user_id))
 
 @app.get("/api/documents/{document_id}/questions/metadata", response_model=DocumentQuestionsMetadataResponse)
 async def get_document_questions_metadata_endpoint(
@@ -762,13 +732,6 @@ async def get_document_questions_metadata_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get metadata about questions for a document (lastModified, total count, pages with questions)"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -786,13 +749,6 @@ async def get_chat_thread_messages_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get chat thread with its messages. Optionally filter by created_at timestamp."""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Parse since timestamp if provided
     since_datetime = None
     if since:
@@ -811,7 +767,7 @@ async def get_chat_thread_messages_endpoint(
             detail="Thread not found"
         )
     
-    return thread_with_messages
+    return json_response(thread_with_messages)
 
 @app.post("/api/chat/threads/{thread_id}/messages")
 async def send_chat_message(
@@ -821,13 +777,6 @@ async def send_chat_message(
     db: Session = Depends(get_db)
 ):
     """Send a message to a chat thread and stream the AI response"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Get thread with messages to verify ownership and get document info
     thread_with_messages = get_chat_thread_with_messages(db, thread_id, user_id)
     if not thread_with_messages:
@@ -860,18 +809,19 @@ async def send_chat_message(
     chapter_id = request.chapterId if context_type == "chapter" and request.chapterId else None
     
     # Check questions limit before proceeding
-    usage_data = get_user_usage(db, user_id)
-    if not usage_data:
+    # (the usage loaded here is reused for the token check once the reply is saved)
+    user_usage = get_user_usage(db, user_id)
+    if not user_usage:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Unable to determine usage limits"
         )
     
-    if usage_data.questionsCount >= usage_data.limits.maxQuestionsPerMonth:
+    if user_usage.questionsCount >= user_usage.limits.maxQuestionsPerMonth:
         raise LimitExceededError(
             limit_type="question",
-            limit_value=usage_data.limits.maxQuestionsPerMonth,
-            current_usage=usage_data.questionsCount,
+            limit_value=user_usage.limits.maxQuestionsPerMonth,
+            current_usage=user_usage.questionsCount,
             limit_period="month"
         )
     
@@ -887,12 +837,11 @@ async def send_chat_message(
     
     # Resolve context-related metadata
     current_page = request.pageContext
-    total_pages = 100  # Default fallback until exact page count is known
+    total_pages = document.page_count or 100  # Fallback until the PDF has been parsed
     effective_context_type = context_type if use_context else "none"
     
     chapter_info = None
     if use_context and context_type == "chapter" and chapter_id:
-        from models import DocumentStructure
         chapter = db.query(DocumentStructure).filter(DocumentStructure.id == uuid.UUID(chapter_id)).first()
         if chapter:
             chapter_info = {
@@ -915,18 +864,13 @@ async def send_chat_message(
                     detail="Supabase storage not available"
                 )
             
-            signed_url_response = supabase.storage.from_('pdfs').create_signed_url(
-                document.storage_key,
-                expires_in=3600
-            )
+            pdf_url = await create_signed_url(document.storage_key, expires_in=3600)
             
-            if not signed_url_response.get('signedURL'):
+            if not pdf_url:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Failed to create signed URL"
                 )
-            
-            pdf_url = signed_url_response['signedURL']
         
         except Exception as e:
             raise HTTPException(
@@ -965,7 +909,7 @@ async def send_chat_message(
     full_context_payload = "\n\n---\n\n".join(context_sections)
     
     # Save user message with compiled context payload
-    user_message = create_chat_message(
+    create_chat_message(
         db,
         thread_id,
         "user",
@@ -985,6 +929,60 @@ async def send_chat_message(
     # Add the new user message
     ai_messages.append({"role": "user", "content": request.content})
     
+    async def persist_assistant_message(
+        content: str,
+        tokens_used: int,
+        page_context: Optional[int],
+        message_context_type: ContextTypeLiteral,
+        message_chapter_id: Optional[str]
+    ):
+        """Save the assistant reply, bump the thread timestamp and count the exchange against the
+        user's usage. Returns the (id, created_at) row."""
+        # RETURNING fetches the server-generated created_at in the same round trip
+        # Writes go through a dedicated async session so they don't block the event loop
+        thread_uuid = uuid.UUID(thread_id)
+        # The thread timestamp bump rides along as a data-modifying CTE: one statement, one round trip
+        touch_thread = update(ChatThread)\
+            .where(ChatThread.id == thread_uuid)\
+            .values(updated_at=func.now())\
+            .cte("touch_thread")
+        async with AsyncSessionLocal() as async_db:
+            assistant_row = (await async_db.execute(
+                insert(ChatMessage)
+                .values(
+                    id=uuid7(),
+                    thread_id=thread_uuid,
+                    role="assistant",
+                    content=content,
+                    page_context=page_context,
+                    context_type=message_context_type,
+                    chapter_id=uuid.UUID(message_chapter_id) if message_chapter_id else None,
+                    context_text=full_context_payload,
+                    tokens_used=tokens_used if tokens_used > 0 else None,
+                    usage_tracked_at=func.now() if tokens_used > 0 else None
+                )
+                .add_cte(touch_thread)
+                .returning(ChatMessage.id, ChatMessage.created_at)
+            )).one()
+            
+            # Usage counters go in the same transaction, for the period loaded at request start
+            if tokens_used > 0:
+                await async_db.execute(usage_increment_statement(
+                    uuid.UUID(user_id),
+                    uuid.UUID(user_usage.planId),
+                    date.fromisoformat(user_usage.periodStart),
+                    date.fromisoformat(user_usage.periodEnd),
+                    tokens=tokens_used,
+                    questions=1
+                ))
+            
+            await async_db.commit()
+        
+        if tokens_used > 0:
+            invalidate_user_usage(user_id)
+        
+        return assistant_row
+    
     # If use_context is False, don't add any context to AI
     if not use_context:
         async def generate_response():
@@ -993,6 +991,7 @@ async def send_chat_message(
             tokens_used = 0
             prompt_tokens = 0
             completion_tokens = 0
+            persist_task = None
             
             try:
                 # Stream AI response without PDF context
@@ -1003,49 +1002,35 @@ async def send_chat_message(
                         prompt_tokens = usage_data.get('prompt_tokens', 0)
                         completion_tokens = usage_data.get('completion_tokens', 0)
                         tokens_used = prompt_tokens + completion_tokens
+                        # Usage is the last event, so the reply is complete: start saving
+                        # it while the provider stream closes
+                        persist_task = start_persist_task(persist_assistant_message(
+                            assistant_content, tokens_used, None, "none", None
+                        ))
                     elif isinstance(chunk, str):
                         assistant_content += chunk
                         yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
                 
                 # Save complete assistant message with token usage
-                from models import ChatMessage as ChatMessageModel
-                assistant_message_model = ChatMessageModel(
-                    id=uuid.uuid4(),
-                    thread_id=uuid.UUID(thread_id),
+                if persist_task is None:
+                    persist_task = start_persist_task(persist_assistant_message(
+                        assistant_content, tokens_used, None, "none", None
+                    ))
+                # Shielded: a client disconnect cancels this generator, not the save
+                assistant_row = await asyncio.shield(persist_task)
+                
+                assistant_message = MessageResponse.model_construct(
+                    id=assistant_row.id,
                     role="assistant",
                     content=assistant_content,
-                    page_context=None,
-                    context_type="none",
-                    chapter_id=None,
-                    context_text=full_context_payload,
-                    tokens_used=tokens_used if tokens_used > 0 else None,
-                    usage_tracked_at=datetime.utcnow() if tokens_used > 0 else None
-                )
-                db.add(assistant_message_model)
-                
-                # Update thread's updated_at timestamp
-                thread = db.query(ChatThread).filter(ChatThread.id == uuid.UUID(thread_id)).first()
-                if thread:
-                    thread.updated_at = datetime.utcnow()
-                
-                db.commit()
-                
-                assistant_message = MessageResponse(
-                    id=str(assistant_message_model.id),
-                    role=assistant_message_model.role,
-                    content=assistant_message_model.content,
-                    pageContext=assistant_message_model.page_context,
-                    contextType=assistant_message_model.context_type,
-                    chapterId=str(assistant_message_model.chapter_id) if assistant_message_model.chapter_id else None,
-                    createdAt=assistant_message_model.created_at.isoformat()
+                    pageContext=None,
+                    contextType="none",
+                    chapterId=None,
+                    createdAt=assistant_row.created_at
                 )
                 
-                # Update usage counters
-                if tokens_used > 0:
-                    increment_user_usage(db, user_id, tokens=tokens_used, questions=1)
-                
                 # Send completion signal
-                yield f"data: {json.dumps({'type': 'complete', 'messageId': assistant_message.id})}\n\n"
+                yield f"data: {json.dumps({'type': 'complete', 'messageId': str(assistant_message.id)})}\n\n"
                 
             except Exception as e:
                 # Send error signal
@@ -1053,12 +1038,8 @@ async def send_chat_message(
         
         return StreamingResponse(
             generate_response(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
-            }
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
         )
     
     async def generate_response():
@@ -1067,6 +1048,7 @@ async def send_chat_message(
         tokens_used = 0
         prompt_tokens = 0
         completion_tokens = 0
+        persist_task = None
         
         try:
             # Stream AI response with context type
@@ -1086,54 +1068,43 @@ async def send_chat_message(
                     prompt_tokens = usage_data.get('prompt_tokens', 0)
                     completion_tokens = usage_data.get('completion_tokens', 0)
                     tokens_used = prompt_tokens + completion_tokens
+                    # Usage is the last event, so the reply is complete: start saving
+                    # it while the provider stream closes
+                    persist_task = start_persist_task(persist_assistant_message(
+                        assistant_content, tokens_used, current_page, effective_context_type, chapter_id
+                    ))
                 elif isinstance(chunk, str):
                     assistant_content += chunk
                     yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
             
             # Save complete assistant message with token usage
-            from models import ChatMessage as ChatMessageModel
-            assistant_message_model = ChatMessageModel(
-                id=uuid.uuid4(),
-                thread_id=uuid.UUID(thread_id),
+            if persist_task is None:
+                persist_task = start_persist_task(persist_assistant_message(
+                    assistant_content, tokens_used, current_page, effective_context_type, chapter_id
+                ))
+            # Shielded: a client disconnect cancels this generator, not the save
+            assistant_row = await asyncio.shield(persist_task)
+            
+            assistant_message = MessageResponse.model_construct(
+                id=assistant_row.id,
                 role="assistant",
                 content=assistant_content,
-                page_context=current_page,
-                context_type=effective_context_type,
-                chapter_id=uuid.UUID(chapter_id) if chapter_id else None,
-                    context_text=full_context_payload,
-                tokens_used=tokens_used if tokens_used > 0 else None,
-                usage_tracked_at=datetime.utcnow() if tokens_used > 0 else None
+                pageContext=current_page,
+                contextType=effective_context_type,
+                chapterId=uuid.UUID(chapter_id) if chapter_id else None,
+                createdAt=assistant_row.created_at
             )
-            db.add(assistant_message_model)
-            
-            # Update thread's updated_at timestamp
-            thread = db.query(ChatThread).filter(ChatThread.id == uuid.UUID(thread_id)).first()
-            if thread:
-                thread.updated_at = datetime.utcnow()
             
-            db.commit()
-            
-            assistant_message = MessageResponse(
-                id=str(assistant_message_model.id),
-                role=assistant_message_model.role,
-                content=assistant_message_model.content,
-                pageContext=assistant_message_model.page_context,
-                contextType=assistant_message_model.context_type,
-                chapterId=str(assistant_message_model.chapter_id) if assistant_message_model.chapter_id else None,
-                createdAt=assistant_message_model.created_at.isoformat()
-            )
-            
-            # Update usage counters
+            # Usage counters were updated with the reply. The token limit is evaluated against
+            # the usage loaded at request start (no database access here)
             if tokens_used > 0:
-                # Check token limit before incrementing
-                allowed, error_msg = check_tokens_limit(db, user_id, tokens_used)
+                allowed, error_msg = check_tokens_limit(db, user_id, tokens_used, usage_data=user_usage)
                 if not allowed:
                     # Already exceeded, but we've used the tokens, so just log it
                     pass
-                increment_user_usage(db, user_id, tokens=tokens_used, questions=1)
             
             # Send completion signal
-            yield f"data: {json.dumps({'type': 'complete', 'messageId': assistant_message.id})}\n\n"
+            yield f"data: {json.dumps({'type': 'complete', 'messageId': str(assistant_message.id)})}\n\n"
             
         except Exception as e:
             # Send error signal
@@ -1141,30 +1112,83 @@ async def send_chat_message(
     
     return StreamingResponse(
         generate_response(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-        }
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
     )
 
 # Document structure endpoints
-@app.post("/api/documents/{document_id}/extract-structure", response_model=DocumentStructureResponse)
-async def extract_document_structure(
-    document_id: str,
+# Documents per extract_many call when re-indexing: bounds concurrent downloads and temp files
+REINDEX_BATCH_SIZE = 8
+
+def record_extracted_pdf_metadata(document: Document, page_count: Optional[int], checksum: Optional[str]) -> None:
+    """Cache the page count so chat prompts don't need to re-open the PDF.
+    The hash computed while streaming is authoritative: it replaces whatever checksum the
+    client sent, and marks it verified so later uploads of the same file can reuse this outline"""
+    if page_count and document.page_count != page_count:
+        document.page_count = page_count
+    if checksum:
+        if document.checksum_sha256 != checksum:
+            document.checksum_sha256 = checksum
+        if not document.checksum_verified:
+            document.checksum_verified = True
+
+@app.post("/api/documents/extract-structure", response_model=ReindexStructureResponse)
+async def reindex_document_structures(
     request: ExtractStructureRequest,
     user_id: str = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Extract document structure (TOC) from PDF"""
-    # Check database connectivity
-    if not test_database_connection():
+    """Extract the structure of all the user's documents that have none yet, or of every
+    owned document with force. PDFs are downloaded concurrently and parsed in worker processes."""
+    if not supabase:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
+            detail="Supabase storage not available"
         )
     
+    documents = list_documents_for_extraction(db, user_id, missing_only=not request.force)
+    reindexed: List[str] = []
+    failed: List[str] = []
+    
+    for start in range(0, len(documents), REINDEX_BATCH_SIZE):
+        batch = documents[start:start + REINDEX_BATCH_SIZE]
+        pdf_urls = await asyncio.gather(*(
+            create_signed_url(document.storage_key, expires_in=3600) for document in batch
+        ), return_exceptions=True)
+        
+        signed = []
+        for document, url in zip(batch, pdf_urls):
+            if isinstance(url, str):
+                signed.append((document, url))
+            else:
+                logging.error("Failed to create signed URL for document %s: %s", document.id, url)
+                failed.append(str(document.id))
+        results = await extract_many([url for _, url in signed], app.state.http)
+        
+        for (document, _), (structure_items, page_count, checksum) in zip(signed, results):
+            document_id = str(document.id)
+            if page_count is None:
+                failed.append(document_id)
+                continue
+            
+            record_extracted_pdf_metadata(document, page_count, checksum)
+            if db.dirty:
+                db.commit()
+            # Like the single-document endpoint, an empty outline leaves any existing structure alone
+            if structure_items:
+                save_document_structure(db, document_id, structure_items)
+            reindexed.append(document_id)
+    
+    return ReindexStructureResponse(reindexed=reindexed, failed=failed)
+
+@app.post("/api/documents/{document_id}/extract-structure", response_model=DocumentStructureResponse)
+async def extract_document_structure(
+    document_id: str,
+    request: ExtractStructureRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Extract document structure (TOC) from PDF"""
     # Verify document exists and belongs to user
     document = get_document_by_id(db, document_id, user_id)
     if not document:
@@ -1176,47 +1200,55 @@ async def extract_document_structure(
     # Check if structure already exists
     existing_structure = get_document_structure(db, document_id)
     if existing_structure and not request.force:
-        return existing_structure
+        return json_response(existing_structure)
     
     try:
-        # Get document view URL
-        if not supabase:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Supabase storage not available"
-            )
-        
-        signed_url_response = supabase.storage.from_('pdfs').create_signed_url(
-            document.storage_key,
-            expires_in=3600
-        )
-        
-        if not signed_url_response.get('signedURL'):
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create signed URL"
-            )
+        # A byte-identical PDF has the same outline, so reuse it when we can
+        cached = None
+        if document.checksum_sha256 and not request.force:
+            cached = get_structure_items_by_checksum(db, document.checksum_sha256, document_id, document.owner_id)
         
-        pdf_url = signed_url_response['signedURL']
+        checksum = None
+        if cached:
+            structure_items, page_count = cached
+        else:
+            # Get document view URL
+            if not supabase:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Supabase storage not available"
+                )
+            
+            pdf_url = await create_signed_url(document.storage_key, expires_in=3600)
+            
+            if not pdf_url:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to create signed URL"
+                )
+            
+            # Extract outline from PDF
+            structure_items, page_count, checksum = await extract_pdf_outline(pdf_url, app.state.http)
         
-        # Extract outline from PDF
-        structure_items = await extract_pdf_outline(pdf_url)
+        record_extracted_pdf_metadata(document, page_count, checksum)
+        if db.dirty:
+            db.commit()
         
         if not structure_items:
             # Return empty structure response
-            return DocumentStructureResponse(
+            return json_response(DocumentStructureResponse.model_construct(
                 documentId=document_id,
                 items=[]
-            )
+            ))
         
         # Save structure to database
         save_document_structure(db, document_id, structure_items)
         
         # Return saved structure
-        return get_document_structure(db, document_id) or DocumentStructureResponse(
+        return json_response(get_document_structure(db, document_id) or DocumentStructureResponse.model_construct(
             documentId=document_id,
             items=[]
-        )
+        ))
         
     except Exception as e:
         raise HTTPException(
@@ -1231,13 +1263,6 @@ async def get_document_structure_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get document structure. Works for owned and shared documents."""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -1245,16 +1270,16 @@ async def get_document_structure_endpoint(
             detail="Document not found"
         )
     
-    structure = get_document_structure(db, document_id)
+    structure_json = get_document_structure_json(db, document_id)
     
-    if not structure:
+    if not structure_json:
         # Return empty structure
-        return DocumentStructureResponse(
+        return json_response(DocumentStructureResponse.model_construct(
             documentId=document_id,
             items=[]
-        )
+        ))
     
-    return structure
+    return Response(content=structure_json, media_type="application/json")
 
 @app.get("/api/documents/{document_id}/pages/{page_number}/chapter")
 async def get_chapter_for_page(
@@ -1265,13 +1290,6 @@ async def get_chapter_for_page(
     db: Session = Depends(get_db)
 ):
     """Get chapter/section information for a specific page. Works for owned and shared documents."""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     # Verify document exists and user has access (ownership or shared)
     if not check_user_has_document_access(db, document_id, user_id):
         raise HTTPException(
@@ -1281,7 +1299,6 @@ async def get_chapter_for_page(
     
     # If level is specified, get structure at that level, otherwise get the most specific one
     if level is not None:
-        from repository import get_nearest_chapter
         chapter = get_nearest_chapter(db, document_id, page_number, level)
     else:
         chapter = get_chapter_by_page(db, document_id, page_number)
@@ -1304,13 +1321,6 @@ async def get_user_plan_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get current user's plan"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     plan = get_user_plan(db, user_id)
     if not plan:
         # Create default beta plan if none exists
@@ -1332,13 +1342,6 @@ async def set_user_plan_endpoint(
     db: Session = Depends(get_db)
 ):
     """Set or change user's plan"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     try:
         plan = set_user_plan(db, user_id, request.planType)
         return UserPlanResponse(
@@ -1361,13 +1364,6 @@ async def get_user_usage_endpoint(
     db: Session = Depends(get_db)
 ):
     """Get current user's resource usage"""
-    # Check database connectivity
-    if not test_database_connection():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available"
-        )
-    
     usage_data = get_user_usage(db, user_id)
     if not usage_data:
         raise HTTPException(
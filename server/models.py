@@ -1,376 +1,207 @@
-from sqlalchemy import Column, String, BigInteger, DateTime, Text, Integer, ForeignKey, Date
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import BigInteger, Boolean, DateTime, Text, Integer, ForeignKey, Date, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import ENUM, UUID
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
-from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
-from datetime import date
+from sqlalchemy.orm import DeclarativeBase, Mapped, WriteOnlyMapped, mapped_column, relationship
+from typing import Optional, List
+from datetime import date, datetime
+import os
+import time
 import uuid
 
-Base = declarative_base()
+class Base(DeclarativeBase):
+    pass
+
+# Native Postgres enum types, created by the 20261015093000_native_enums migration
+MESSAGE_ROLE = ENUM('user', 'assistant', name='message_role', create_type=False)
+MESSAGE_CONTEXT_TYPE = ENUM('page', 'chapter', 'none', name='message_context_type', create_type=False)
+PLAN_TYPE = ENUM('beta', 'base', 'plus', name='plan_type', create_type=False)
+PLAN_STATUS = ENUM('active', 'trial', 'expired', name='plan_status', create_type=False)
+
+def uuid7() -> uuid.UUID:
+    """Generate a time-ordered UUIDv7 (48-bit unix ms timestamp + random bits).
+    New rows land at the right edge of the primary key B-tree instead of random pages."""
+    unix_ms = time.time_ns() // 1_000_000
+    value = (unix_ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return uuid.UUID(int=value)
 
 class Document(Base):
     __tablename__ = "documents"
-    
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    owner_id = Column(UUID(as_uuid=True), nullable=True)
-    title = Column(Text, nullable=True)
-    storage_key = Column(Text, nullable=False)
-    size_bytes = Column(BigInteger, nullable=True)
-    mime = Column(Text, nullable=True)
-    checksum_sha256 = Column(Text, nullable=True)
-    status = Column(Text, default="created")
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    uploaded_by_session = Column(Text, nullable=True)
-    last_viewed_page = Column(Integer, default=1)
-    last_viewed_at = Column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (
+        # Outline reuse: only server-verified checksums, within one owner
+        Index('idx_documents_checksum', 'owner_id', 'checksum_sha256', postgresql_where=text('checksum_verified')),
+    )
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    owner_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)
+    title: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    storage_key: Mapped[str] = mapped_column(Text, nullable=False)
+    size_bytes: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    mime: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    checksum_sha256: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    checksum_verified: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default=text('false'))  # Computed by the server, not client-supplied
+    status: Mapped[Optional[str]] = mapped_column(Text, default="created")
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    uploaded_by_session: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    last_viewed_page: Mapped[Optional[int]] = mapped_column(Integer, default=1)
+    last_viewed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    page_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Filled in when the PDF is first parsed
     
     # Relationship to chat threads
-    chat_threads = relationship("ChatThread", back_populates="document", cascade="all, delete-orphan")
+    chat_threads: WriteOnlyMapped["ChatThread"] = relationship("ChatThread", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
     # Relationship to document structure
-    structure = relationship("DocumentStructure", back_populates="document", cascade="all, delete-orphan")
+    structure: Mapped[List["DocumentStructure"]] = relationship("DocumentStructure", back_populates="document", cascade="all, delete-orphan", passive_deletes=True, lazy="raise_on_sql")
 
 class ChatThread(Base):
     __tablename__ = "chat_threads"
+    __table_args__ = (
+        Index('idx_chat_threads_document_user_updated', 'document_id', 'user_id', 'updated_at'),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
-    title = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    title: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
-    document = relationship("Document", back_populates="chat_threads")
-    messages = relationship("ChatMessage", back_populates="thread", cascade="all, delete-orphan")
+    document: Mapped["Document"] = relationship("Document", back_populates="chat_threads")
+    messages: WriteOnlyMapped["ChatMessage"] = relationship("ChatMessage", back_populates="thread", cascade="all, delete-orphan", passive_deletes=True)
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
-    
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    thread_id = Column(UUID(as_uuid=True), ForeignKey("chat_threads.id", ondelete="CASCADE"), nullable=False)
-    role = Column(Text, nullable=False)  # 'user' or 'assistant'
-    content = Column(Text, nullable=False)
-    page_context = Column(Integer, nullable=True)  # Page number when message was sent
-    chapter_id = Column(UUID(as_uuid=True), ForeignKey("document_structure.id", ondelete="SET NULL"), nullable=True)
-    context_type = Column(Text, default="page")  # 'page', 'chapter', 'none'
-    context_text = Column(Text, nullable=True)  # Raw context text provided to the assistant
-    tokens_used = Column(Integer, nullable=True)  # Tokens used for this message (AI responses)
-    usage_tracked_at = Column(DateTime(timezone=True), nullable=True)  # When usage was tracked
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index('idx_chat_messages_thread_created', 'thread_id', 'created_at'),
+        Index('idx_chat_messages_thread_page', 'thread_id', 'page_context'),
+        Index('idx_chat_messages_thread_page_questions', 'thread_id', 'page_context', text('created_at DESC'), postgresql_where=text("role = 'user'")),
+        Index('idx_chat_messages_thread_answers', 'thread_id', 'created_at', postgresql_where=text("role = 'assistant'")),
+        Index('idx_chat_messages_created_brin', 'created_at', postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+    )
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    thread_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("chat_threads.id", ondelete="CASCADE"), nullable=False)
+    role: Mapped[str] = mapped_column(MESSAGE_ROLE, nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    page_context: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Page number when message was sent
+    chapter_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("document_structure.id", ondelete="SET NULL"), nullable=True)
+    context_type: Mapped[Optional[str]] = mapped_column(MESSAGE_CONTEXT_TYPE, default="page")
+    context_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Raw context text provided to the assistant
+    tokens_used: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # Tokens used for this message (AI responses)
+    usage_tracked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)  # When usage was tracked
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    thread = relationship("ChatThread", back_populates="messages")
-    chapter = relationship("DocumentStructure", foreign_keys=[chapter_id])
+    thread: Mapped["ChatThread"] = relationship("ChatThread", back_populates="messages")
+    chapter: Mapped[Optional["DocumentStructure"]] = relationship("DocumentStructure", foreign_keys=[chapter_id], lazy="raise_on_sql")
 
 class UserPlan(Base):
     __tablename__ = "user_plans"
-    
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
-    plan_type = Column(Text, nullable=False)  # 'beta', 'base', 'plus'
-    status = Column(Text, nullable=False, default='active')  # 'active', 'trial', 'expired'
-    started_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
-    expires_at = Column(DateTime(timezone=True), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    __table_args__ = (
+        Index('idx_user_plans_user_active', 'user_id', text('started_at DESC'), postgresql_where=text("status = 'active'")),
+    )
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    plan_type: Mapped[str] = mapped_column(PLAN_TYPE, nullable=False)
+    status: Mapped[str] = mapped_column(PLAN_STATUS, nullable=False, default='active')
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
-    usage_records = relationship("UserUsage", back_populates="plan", cascade="all, delete-orphan")
+    usage_records: Mapped[List["UserUsage"]] = relationship("UserUsage", back_populates="plan", cascade="all, delete-orphan", passive_deletes=True, lazy="raise_on_sql")
 
 class PlanLimits(Base):
     __tablename__ = "plan_limits"
     
-    plan_type = Column(Text, primary_key=True)
-    max_storage_bytes = Column(BigInteger, nullable=False)
-    max_files = Column(Integer, nullable=True)  # NULL means unlimited
-    max_single_file_bytes = Column(BigInteger, nullable=False)
-    max_tokens_per_month = Column(BigInteger, nullable=False)
-    max_questions_per_month = Column(Integer, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    plan_type: Mapped[str] = mapped_column(PLAN_TYPE, primary_key=True)
+    max_storage_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    max_files: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # NULL means unlimited
+    max_single_file_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    max_tokens_per_month: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    max_questions_per_month: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 class UserUsage(Base):
     __tablename__ = "user_usage"
-    
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
-    plan_id = Column(UUID(as_uuid=True), ForeignKey("user_plans.id", ondelete="CASCADE"), nullable=False)
-    period_start = Column(Date, nullable=False)
-    period_end = Column(Date, nullable=False)
-    storage_bytes_used = Column(BigInteger, default=0)
-    files_count = Column(Integer, default=0)
-    tokens_used = Column(BigInteger, default=0)
-    questions_count = Column(Integer, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    __table_args__ = (
+        UniqueConstraint('user_id', 'period_start'),
+        Index('idx_user_usage_period', 'user_id', 'period_start', 'period_end'),
+        Index('idx_user_usage_period_start_brin', 'period_start', postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+    )
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    plan_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("user_plans.id", ondelete="CASCADE"), nullable=False)
+    period_start: Mapped[date] = mapped_column(Date, nullable=False)
+    period_end: Mapped[date] = mapped_column(Date, nullable=False)
+    storage_bytes_used: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
+    files_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    tokens_used: Mapped[Optional[int]] = mapped_column(BigInteger, default=0)
+    questions_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
-    plan = relationship("UserPlan", back_populates="usage_records")
-
-# Pydantic models for API requests/responses
-class CreateDocumentRequest(BaseModel):
-    title: Optional[str] = None
-    storage_key: str = Field(alias="storageKey")
-    size_bytes: int = Field(alias="sizeBytes")
-    mime: str
-    checksum_sha256: Optional[str] = Field(None, alias="checksumSha256")
-    
-    class Config:
-        allow_population_by_field_name = True  # Allow both snake_case and camelCase
-
-class DocumentResponse(BaseModel):
-    id: str
-    title: Optional[str] = None
-    storageKey: str
-    sizeBytes: Optional[int]
-    mime: Optional[str] = None
-    status: str
-    createdAt: str
-    lastViewedPage: Optional[int] = None
-    isShared: Optional[bool] = False  # True if document is shared (not owned by current user)
-    hasActiveShare: Optional[bool] = False  # True if document has an active share link (created by current user)
-    questionsCount: Optional[int] = 0  # Number of questions asked for this document
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class UpdateProgressRequest(BaseModel):
-    page: int
-
-# Chat-related Pydantic models
-class CreateThreadRequest(BaseModel):
-    title: Optional[str] = None
-
-class ThreadResponse(BaseModel):
-    id: str
-    title: str
-    createdAt: str
-    updatedAt: str
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class CreateMessageRequest(BaseModel):
-    content: str
-    pageContext: Optional[int] = Field(None, alias="pageContext")
-    contextType: Optional[Literal['page', 'chapter', 'none']] = Field(None, alias="contextType")
-    chapterId: Optional[str] = Field(None, alias="chapterId")
-    
-    class Config:
-        allow_population_by_field_name = True
-
-class MessageResponse(BaseModel):
-    id: str
-    role: str
-    content: str
-    pageContext: Optional[int] = None
-    contextType: Optional[Literal['page', 'chapter', 'none']] = None
-    chapterId: Optional[str] = None
-    createdAt: str
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
+    plan: Mapped["UserPlan"] = relationship("UserPlan", back_populates="usage_records")
 
 class DocumentStructure(Base):
     __tablename__ = "document_structure"
-    
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
-    title = Column(Text, nullable=False)
-    level = Column(Integer, nullable=False, default=1)
-    page_from = Column(Integer, nullable=False)
-    page_to = Column(Integer, nullable=True)
-    parent_id = Column(UUID(as_uuid=True), ForeignKey("document_structure.id", ondelete="CASCADE"), nullable=True)
-    order_index = Column(Integer, nullable=False, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index('idx_document_structure_document_order', 'document_id', 'order_index'),
+        Index('idx_document_structure_document_level_page', 'document_id', 'level', 'page_from'),
+        Index('idx_document_structure_parent', 'parent_id'),
+    )
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    title: Mapped[str] = mapped_column(Text, nullable=False)
+    level: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    page_from: Mapped[int] = mapped_column(Integer, nullable=False)
+    page_to: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    parent_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("document_structure.id", ondelete="CASCADE"), nullable=True)
+    order_index: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    document = relationship("Document", back_populates="structure")
-    parent = relationship("DocumentStructure", remote_side=[id], backref="children")
+    document: Mapped["Document"] = relationship("Document", back_populates="structure")
+    parent: Mapped[Optional["DocumentStructure"]] = relationship("DocumentStructure", remote_side=[id], back_populates="children")
+    children: Mapped[List["DocumentStructure"]] = relationship("DocumentStructure", back_populates="parent", passive_deletes=True, lazy="raise_on_sql")
 
 class DocumentShare(Base):
     __tablename__ = "document_shares"
-    
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
-    share_token = Column(Text, nullable=False, unique=True)
-    created_by = Column(UUID(as_uuid=True), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    revoked_at = Column(DateTime(timezone=True), nullable=True)
-    expires_at = Column(DateTime(timezone=True), nullable=True)
+    __table_args__ = (
+        Index('idx_document_shares_document', 'document_id', 'revoked_at'),
+        # Most lookups only care about active shares; newest first for get_active_document_share
+        Index('idx_document_shares_active', 'document_id', text('created_at DESC'), postgresql_where=text('revoked_at IS NULL')),
+    )
+    
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    document_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    share_token: Mapped[str] = mapped_column(Text, nullable=False, unique=True)
+    created_by: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    revoked_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     
     # Relationships
-    document = relationship("Document")
-    access_records = relationship("DocumentShareAccess", back_populates="share", cascade="all, delete-orphan")
+    document: Mapped["Document"] = relationship("Document")
+    access_records: Mapped[List["DocumentShareAccess"]] = relationship("DocumentShareAccess", back_populates="share", cascade="all, delete-orphan")
 
 class DocumentShareAccess(Base):
     __tablename__ = "document_share_access"
+    __table_args__ = (
+        UniqueConstraint('share_id', 'user_id'),
+        Index('idx_document_share_access_accessed_brin', 'accessed_at', postgresql_using='brin', postgresql_with={'pages_per_range': 32}),
+    )
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    share_id = Column(UUID(as_uuid=True), ForeignKey("document_shares.id", ondelete="CASCADE"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), nullable=False)
-    accessed_at = Column(DateTime(timezone=True), server_default=func.now())
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7)
+    share_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("document_shares.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    accessed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    share = relationship("DocumentShare", back_populates="access_records")
-
-class ThreadWithMessagesResponse(BaseModel):
-    id: str
-    title: str
-    createdAt: str
-    updatedAt: str
-    messages: List[MessageResponse]
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-# Page questions related models
-class PageQuestionResponse(BaseModel):
-    id: str
-    threadId: str
-    threadTitle: str
-    content: str
-    answer: str | None = None  # First assistant response to this question
-    createdAt: str
-    userId: str  # ID of the user who asked the question
-    isOwn: bool  # Whether this question belongs to the current user
-    canOpenThread: bool  # Whether the thread can be opened (only for own questions)
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class PageQuestionsResponse(BaseModel):
-    pageNumber: int
-    totalQuestions: int
-    questions: List[PageQuestionResponse]
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class AllDocumentQuestionsResponse(BaseModel):
-    documentId: str
-    lastModified: str  # ISO timestamp of the most recent question/answer
-    pages: List[PageQuestionsResponse]  # Questions grouped by page
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class DocumentQuestionsMetadataResponse(BaseModel):
-    documentId: str
-    lastModified: str  # ISO timestamp of the most recent question/answer
-    totalQuestions: int
-    pagesWithQuestions: List[int]  # List of page numbers that have questions
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-# Document structure related models
-class DocumentStructureItem(BaseModel):
-    id: str
-    title: str
-    level: int
-    pageFrom: int
-    pageTo: Optional[int]
-    parentId: Optional[str]
-    orderIndex: int
-    children: Optional[List['DocumentStructureItem']] = []
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class DocumentStructureResponse(BaseModel):
-    documentId: str
-    items: List[DocumentStructureItem]
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class ExtractStructureRequest(BaseModel):
-    force: bool = False
-
-# User plan and usage related models
-class UserPlanResponse(BaseModel):
-    id: str
-    userId: str
-    planType: str
-    status: str
-    startedAt: str
-    expiresAt: Optional[str] = None
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class PlanLimitsResponse(BaseModel):
-    planType: str
-    maxStorageBytes: int
-    maxFiles: Optional[int] = None
-    maxSingleFileBytes: int
-    maxTokensPerMonth: int
-    maxQuestionsPerMonth: int
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class UserUsageResponse(BaseModel):
-    userId: str
-    planId: str
-    planType: str
-    periodStart: str
-    periodEnd: str
-    storageBytesUsed: int
-    filesCount: int
-    tokensUsed: int
-    questionsCount: int
-    limits: PlanLimitsResponse
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class SetUserPlanRequest(BaseModel):
-    planType: str = Field(..., pattern="^(beta|base|plus)$")
-    
-    class Config:
-        allow_population_by_field_name = True
-
-# Document sharing related models
-class ShareDocumentRequest(BaseModel):
-    expiresAt: Optional[str] = None  # ISO datetime string
-    
-    class Config:
-        allow_population_by_field_name = True
-
-class ShareDocumentResponse(BaseModel):
-    shareToken: str
-    shareUrl: str  # Full URL to access the shared document
-    createdAt: str
-    expiresAt: Optional[str] = None
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-
-class ShareStatusResponse(BaseModel):
-    hasActiveShare: bool
-    shareToken: Optional[str] = None
-    shareUrl: Optional[str] = None
-    createdAt: Optional[str] = None
-    revokedAt: Optional[str] = None
-    expiresAt: Optional[str] = None
-    
-    class Config:
-        from_attributes = True
-        populate_by_name = True
+    share: Mapped["DocumentShare"] = relationship("DocumentShare", back_populates="access_records")
@@ -1,101 +1,174 @@
+import asyncio
+import hashlib
 import logging
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
-from typing import List, Dict, Any, Optional
-import uuid
-from io import BytesIO
+import msgspec
+from typing import IO, List, Optional, Tuple
+from models import uuid7
+from schemas import StructureItem
 import httpx
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
-async def extract_pdf_outline(pdf_url: str) -> List[Dict[str, Any]]:
+# Created on first use by extract_many
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+async def _download_to_file(client: httpx.AsyncClient, url: str, file: IO[bytes]) -> str:
+    """Stream a remote file into an open binary file object, returning its SHA-256 hex digest"""
+    hasher = hashlib.sha256()
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            file.write(chunk)
+    file.flush()
+    return hasher.hexdigest()
+
+
+def _build_outline(toc: List[list], num_pages: int) -> List[StructureItem]:
+    """Turn a PyMuPDF TOC into flat structure items with parent links and page ranges"""
+    structure_items = []
+    parent_stack = []  # (level, id) of open ancestors, levels strictly increasing
+
+    for i, (level, title, page) in enumerate(toc):
+        # Generate unique ID
+        item_id = str(uuid7())
+        
+        # Close items with higher or equal level; what remains on top is the parent
+        while parent_stack and parent_stack[-1][0] >= level:
+            parent_stack.pop()
+        parent_id = parent_stack[-1][1] if parent_stack else None
+        
+        # Build structure item
+        structure_items.append(StructureItem(
+            id=item_id,
+            title=title.strip(),
+            level=level,
+            pageFrom=max(1, min(page, num_pages)),
+            pageTo=None,  # Will be set later
+            parentId=parent_id,
+            orderIndex=i
+        ))
+        parent_stack.append((level, item_id))
+    
+    # Calculate page_to values in one reverse pass: an item ends right before the
+    # next item at the same or a shallower level, or at the last page
+    next_stack = []  # (level, pageFrom) of following items, levels strictly increasing
+    for item in reversed(structure_items):
+        while next_stack and next_stack[-1][0] > item.level:
+            next_stack.pop()
+        if next_stack:
+            item.pageTo = max(item.pageFrom, next_stack[-1][1] - 1)
+        else:
+            item.pageTo = num_pages
+        next_stack.append((item.level, item.pageFrom))
+    
+    return structure_items
+
+
+def _parse_outline(path: str) -> Tuple[List[StructureItem], int]:
+    """Open a PDF from disk and return (structure items, page count)"""
+    with fitz.open(path) as doc:
+        num_pages = doc.page_count
+        toc = doc.get_toc()
+    return _build_outline(toc, num_pages), num_pages
+
+
+def _parse_outline_encoded(path: str) -> bytes:
+    """Process pool entry point: results go back as msgpack bytes rather than pickled objects"""
+    return msgspec.msgpack.encode(_parse_outline(path))
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # spawn, because forking a process that already runs threads is unsafe
+        _process_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Stop the outline parsing worker processes, if any were started"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+
+async def extract_pdf_outline(
+    pdf_url: str,
+    client: Optional[httpx.AsyncClient] = None
+) -> Tuple[List[StructureItem], Optional[int], Optional[str]]:
     """
     Extract outline/TOC structure from PDF using PyMuPDF
     
+    Args:
+        pdf_url: URL to download the PDF from
+        client: Shared HTTP client to download with; a temporary one is used if omitted
+    
     Returns:
-        List of structure items with format:
-        {
-            'id': str,
-            'title': str,
-            'level': int,
-            'pageFrom': int,
-            'pageTo': Optional[int],
-            'parentId': Optional[str],
-            'orderIndex': int
-        }
+        Tuple of (structure items, page count, SHA-256 of the file). Page count
+        and checksum are None if the PDF could not be downloaded or opened.
     """
     try:
-        # Download PDF
-        async with httpx.AsyncClient() as client:
-            response = await client.get(pdf_url)
-            response.raise_for_status()
-            pdf_data = BytesIO(response.content)
-        
-        # Open PDF
-        doc = fitz.open(stream=pdf_data, filetype="pdf")
-        
-        # Get outline/TOC
-        outline = doc.get_toc()
-        
-        if not outline:
-            logger.info("No outline found in PDF")
-            return []
-        
-        # Build structure
-        structure_items = []
-        item_map = {}  # Maps outline item to our structure item
-        parent_stack = []  # Stack to track hierarchy
-        
-        num_pages = doc.page_count
-
-        for i, (level, title, page) in enumerate(outline):
-            # Generate unique ID
-            item_id = str(uuid.uuid4())
-            
-            # Find parent in stack (last item with level < current level)
-            parent_id = None
-            for parent in reversed(parent_stack):
-                if parent['level'] < level:
-                    parent_id = parent['id']
-                    break
-            
-            # Build structure item
-            item = {
-                'id': item_id,
-                'title': title.strip(),
-                'level': level,
-                'pageFrom': max(1, min(page, num_pages)),
-                'pageTo': None,  # Will be set later
-                'parentId': parent_id,
-                'orderIndex': i
-            }
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            # Stream the PDF to disk instead of buffering it in memory
+            if client is None:
+                async with httpx.AsyncClient() as own_client:
+                    checksum = await _download_to_file(own_client, pdf_url, tmp)
+            else:
+                checksum = await _download_to_file(client, pdf_url, tmp)
             
-            structure_items.append(item)
-            item_map[(level, title, page)] = item
-            
-            # Update parent stack
-            # Remove items with higher or equal level from stack
-            parent_stack = [p for p in parent_stack if p['level'] < level]
-            parent_stack.append({'id': item_id, 'level': level, 'page': page})
-        
-        # Calculate page_to values
-        for i, item in enumerate(structure_items):
-            page_to = num_pages
-            for j in range(i + 1, len(structure_items)):
-                next_item = structure_items[j]
-                if next_item['level'] <= item['level']:
-                    page_to = max(item['pageFrom'], next_item['pageFrom'] - 1)
-                    break
-            item['pageTo'] = page_to
+            # Parsing is CPU-bound, keep it off the event loop
+            structure_items, num_pages = await asyncio.to_thread(_parse_outline, tmp.name)
         
-        doc.close()
-        
-        logger.info(f"Extracted {len(structure_items)} structure items from PDF")
-        return structure_items
+        if not structure_items:
+            logger.info("No outline found in PDF")
+        else:
+            logger.info(f"Extracted {len(structure_items)} structure items from PDF")
+        return structure_items, num_pages, checksum
         
     except Exception as e:
         logger.error(f"Error extracting PDF outline: {e}")
-        return []
+        return [], None, None
+
+
+async def extract_many(
+    pdf_urls: List[str],
+    client: Optional[httpx.AsyncClient] = None
+) -> List[Tuple[List[StructureItem], Optional[int], Optional[str]]]:
+    """
+    Extract outlines for several PDFs at once, e.g. for batch re-indexing.
+    Downloads run concurrently and parsing is spread over a process pool.
+    
+    Returns:
+        One (structure items, page count, checksum) tuple per URL, in the same order and
+        with the same failure convention as extract_pdf_outline.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    
+    async def extract_one(http: httpx.AsyncClient, pdf_url: str) -> Tuple[List[StructureItem], Optional[int], Optional[str]]:
+        try:
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+                checksum = await _download_to_file(http, pdf_url, tmp)
+                payload = await loop.run_in_executor(pool, _parse_outline_encoded, tmp.name)
+            structure_items, num_pages = msgspec.msgpack.decode(payload, type=Tuple[List[StructureItem], int])
+            return structure_items, num_pages, checksum
+        except Exception as e:
+            logger.error(f"Error extracting PDF outline from {pdf_url}: {e}")
+            return [], None, None
+    
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            return await asyncio.gather(*(extract_one(own_client, url) for url in pdf_urls))
+    return await asyncio.gather(*(extract_one(client, url) for url in pdf_urls))
 
 
 def convert_page_number(page_str: str, num_pages: int) -> int:
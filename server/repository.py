@@ -1,27 +1,55 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, or_, func
-from typing import List, Optional, Dict, Any, Literal
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import desc, and_, or_, func, delete, insert, select, true, union, update, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Dict, Any, Literal, Tuple
+import calendar
+import csv
+import io
 import uuid
 import secrets
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
+from collections import defaultdict
+from functools import lru_cache
+from cachetools import TTLCache
 from models import (
-    Document, CreateDocumentRequest, DocumentResponse,
-    ChatThread, ChatMessage, CreateThreadRequest, ThreadResponse,
-    CreateMessageRequest, MessageResponse, ThreadWithMessagesResponse,
+    Document, ChatThread, ChatMessage, DocumentStructure,
+    UserPlan, PlanLimits, UserUsage, DocumentShare, DocumentShareAccess,
+    uuid7
+)
+from schemas import (
+    CreateDocumentRequest, DocumentResponse, DocumentListItem,
+    ThreadResponse, ThreadListItem,
+    MessageResponse, ThreadWithMessagesResponse,
     PageQuestionResponse, PageQuestionsResponse, AllDocumentQuestionsResponse,
-    DocumentQuestionsMetadataResponse, DocumentStructure,
-    DocumentStructureItem, DocumentStructureResponse,
-    UserPlan, PlanLimits, UserUsage, UserPlanResponse, PlanLimitsResponse, UserUsageResponse,
-    DocumentShare, DocumentShareAccess, ShareDocumentResponse, ShareStatusResponse
+    DocumentQuestionsMetadataResponse,
+    DocumentStructureItem, DocumentStructureResponse, StructureItem,
+    PlanLimitsResponse, UserUsageResponse
 )
 
 ContextTypeLiteral = Literal['page', 'chapter', 'none']
 
+# Serialized structure trees by document id. Invalidated locally on save; the short TTL
+# bounds staleness in other worker processes.
+_structure_json_cache: TTLCache = TTLCache(maxsize=4096, ttl=30)
+
+# Plan limits by plan type; rows change only through migrations or manual edits
+_plan_limits_cache: TTLCache = TTLCache(maxsize=16, ttl=60)
+
+# Usage snapshots by user id. Dropped locally whenever the counters or the plan change;
+# the TTL is kept short because limit checks in other workers read from their own copy.
+_user_usage_cache: TTLCache = TTLCache(maxsize=4096, ttl=10)
+
+@lru_cache(maxsize=4096)
+def _uuid(value: str) -> uuid.UUID:
+    """Parse an id string; the same user/document ids are parsed on every request"""
+    return uuid.UUID(value)
+
 def create_document(db: Session, request: CreateDocumentRequest, user_id: str) -> DocumentResponse:
     """Create a new document record"""
     db_document = Document(
-        id=uuid.uuid4(),
-        owner_id=uuid.UUID(user_id),
+        id=uuid7(),
+        owner_id=_uuid(user_id),
         title=request.title,
         storage_key=request.storage_key,
         size_bytes=request.size_bytes,
@@ -34,91 +62,58 @@ def create_document(db: Session, request: CreateDocumentRequest, user_id: str) -
     db.commit()
     db.refresh(db_document)
     
-    return DocumentResponse(
-        id=str(db_document.id),
-        title=db_document.title,
-        storageKey=db_document.storage_key,
-        sizeBytes=db_document.size_bytes,
-        mime=db_document.mime,
-        status=db_document.status,
-        createdAt=db_document.created_at.isoformat(),
-        questionsCount=0
-    )
+    return DocumentResponse.from_orm_fast(db_document, questionsCount=0)
 
-def list_documents(db: Session, user_id: str, limit: int = 50, offset: int = 0) -> List[DocumentResponse]:
+# Only the columns the listing serializes; rows come back as plain tuples, no ORM identity map
+_DOCUMENT_LIST_COLUMNS = (
+    Document.id, Document.title, Document.storage_key, Document.size_bytes, Document.mime,
+    Document.status, Document.created_at, Document.last_viewed_page,
+)
+
+def list_documents(db: Session, user_id: str, limit: int = 50, offset: int = 0) -> List[DocumentListItem]:
     """List documents for a user with pagination. Includes owned documents and shared documents."""
-    user_uuid = uuid.UUID(user_id)
-    
-    # Get owned documents
-    owned_docs = db.query(Document)\
-        .filter(Document.owner_id == user_uuid)\
-        .all()
-    
-    owned_ids = {doc.id for doc in owned_docs}
+    user_uuid = _uuid(user_id)
     
-    # Get shared documents (documents the user has access to)
-    shared_docs = db.query(Document)\
-        .join(DocumentShare, DocumentShare.document_id == Document.id)\
+    # Ids of owned documents plus documents the user has active shared access to;
+    # UNION also deduplicates a document the user owns and opened through a share
+    owned_ids = select(Document.id).where(Document.owner_id == user_uuid)
+    shared_ids = select(DocumentShare.document_id)\
         .join(DocumentShareAccess, DocumentShareAccess.share_id == DocumentShare.id)\
-        .filter(DocumentShareAccess.user_id == user_uuid)\
-        .filter(DocumentShare.revoked_at.is_(None))\
-        .filter(
-            or_(
-                DocumentShare.expires_at.is_(None),
-                DocumentShare.expires_at > datetime.utcnow()
-            )
-        )\
-        .all()
-    
-    shared_ids = {doc.id for doc in shared_docs}
-    
-    # Combine and deduplicate (in case user owns a document they also have shared access to)
-    all_docs = {doc.id: doc for doc in owned_docs}
-    all_docs.update({doc.id: doc for doc in shared_docs})
-    
-    # Get all document IDs to check for active shares
-    all_doc_ids = list(all_docs.keys())
+        .where(DocumentShareAccess.user_id == user_uuid)\
+        .where(DocumentShare.revoked_at.is_(None))\
+        .where(or_(DocumentShare.expires_at.is_(None), DocumentShare.expires_at > func.now()))
+    visible_ids = union(owned_ids, shared_ids).subquery()
     
-    # Check which owned documents have active shares
-    active_shares = db.query(DocumentShare)\
-        .filter(DocumentShare.document_id.in_(all_doc_ids))\
-        .filter(DocumentShare.created_by == user_uuid)\
-        .filter(DocumentShare.revoked_at.is_(None))\
-        .filter(
-            or_(
-                DocumentShare.expires_at.is_(None),
-                DocumentShare.expires_at > datetime.utcnow()
-            )
-        )\
-        .all()
-    
-    documents_with_active_shares = {share.document_id for share in active_shares}
-    
-    # Sort by created_at descending
-    sorted_docs = sorted(all_docs.values(), key=lambda d: d.created_at, reverse=True)
+    # Flags and counts are correlated subqueries, so the whole page is one statement
+    has_active_share = select(DocumentShare.id)\
+        .where(DocumentShare.document_id == Document.id)\
+        .where(DocumentShare.created_by == user_uuid)\
+        .where(DocumentShare.revoked_at.is_(None))\
+        .where(or_(DocumentShare.expires_at.is_(None), DocumentShare.expires_at > func.now()))\
+        .exists()
+    questions_count = select(func.count(ChatMessage.id))\
+        .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
+        .where(ChatThread.document_id == Document.id)\
+        .where(ChatMessage.role == 'user')\
+        .scalar_subquery()
     
-    # Apply pagination
-    paginated_docs = sorted_docs[offset:offset + limit]
-    
-    # Get questions count for each document
-    # Count all user messages (questions) for each document
-    questions_counts = {}
-    if paginated_docs:
-        doc_ids = [doc.id for doc in paginated_docs]
-        questions_counts_result = db.query(
-            ChatThread.document_id,
-            func.count(ChatMessage.id).label('count')
-        ).join(ChatMessage, ChatMessage.thread_id == ChatThread.id)\
-         .filter(ChatThread.document_id.in_(doc_ids))\
-         .filter(ChatMessage.role == 'user')\
-         .group_by(ChatThread.document_id)\
-         .all()
-        
-        questions_counts = {doc_id: count for doc_id, count in questions_counts_result}
+    # Sort and paginate in SQL so only one page of rows comes back
+    paginated_docs = db.execute(
+        select(
+            *_DOCUMENT_LIST_COLUMNS,
+            Document.owner_id.is_distinct_from(user_uuid).label('is_shared'),
+            has_active_share.label('has_active_share'),
+            questions_count.label('questions_count')
+        )
+        .join(visible_ids, visible_ids.c.id == Document.id)
+        .order_by(desc(Document.created_at))
+        .limit(limit)
+        .offset(offset)
+    ).all()
     
     return [
-        DocumentResponse(
-            id=str(doc.id),
+        DocumentListItem(
+            id=doc.id,
             title=doc.title,
             storageKey=doc.storage_key,
             sizeBytes=doc.size_bytes,
@@ -126,9 +121,9 @@ def list_documents(db: Session, user_id: str, limit: int = 50, offset: int = 0)
             status=doc.status,
             createdAt=doc.created_at.isoformat(),
             lastViewedPage=doc.last_viewed_page,
-            isShared=doc.id in shared_ids and doc.id not in owned_ids,
-            hasActiveShare=doc.id in documents_with_active_shares,
-            questionsCount=questions_counts.get(doc.id, 0)
+            isShared=doc.is_shared,
+            hasActiveShare=doc.has_active_share,
+            questionsCount=doc.questions_count
         )
         for doc in paginated_docs
     ]
@@ -136,33 +131,47 @@ def list_documents(db: Session, user_id: str, limit: int = 50, offset: int = 0)
 def get_document_by_id(db: Session, document_id: str, owner_id: str) -> Optional[Document]:
     """Get a document by ID, ensuring it belongs to the owner"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        owner_uuid = uuid.UUID(owner_id)
-        
-        return db.query(Document)\
-            .filter(Document.id == doc_uuid)\
-            .filter(Document.owner_id == owner_uuid)\
-            .first()
+        doc_uuid = _uuid(document_id)
+        owner_uuid = _uuid(owner_id)
+        
+        # lambda_stmt caches the constructed statement; doc_uuid/owner_uuid become bound parameters
+        stmt = lambda_stmt(lambda: select(Document)
+            .where(Document.id == doc_uuid)
+            .where(Document.owner_id == owner_uuid))
+        return db.execute(stmt).scalars().first()
     except ValueError:
         return None
 
+def list_documents_for_extraction(db: Session, owner_id: str, missing_only: bool = True) -> List[Document]:
+    """Owned documents to (re-)extract the structure for; only those without any structure rows
+    unless missing_only is False"""
+    stmt = select(Document).where(Document.owner_id == _uuid(owner_id))
+    if missing_only:
+        stmt = stmt.where(~select(DocumentStructure.id)
+            .where(DocumentStructure.document_id == Document.id)
+            .exists())
+    return list(db.execute(stmt.order_by(Document.created_at)).scalars())
+
 def update_document_progress(db: Session, document_id: str, page: int, user_id: str) -> bool:
     """Update the last viewed page and timestamp for a document. Works for owned and shared documents."""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
-        
-        # Check if user owns the document or has shared access
-        document = get_document_by_id_or_share(db, document_id, user_id)
-        
-        if not document:
-            return False
-        
-        document.last_viewed_page = page
-        document.last_viewed_at = datetime.utcnow()
+        doc_uuid = _uuid(document_id)
+        user_uuid = _uuid(user_id)
+        
+        # Single UPDATE guarded by ownership or shared access; the DB stamps the time
+        result = db.execute(
+            update(Document)
+            .where(Document.id == doc_uuid)
+            .where(or_(
+                Document.owner_id == user_uuid,
+                _shared_access_exists(doc_uuid, user_uuid)
+            ))
+            .values(last_viewed_page=page, last_viewed_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
         
         db.commit()
-        return True
+        return result.rowcount > 0
     except ValueError:
         return False
 
@@ -170,9 +179,9 @@ def update_document_progress(db: Session, document_id: str, page: int, user_id:
 def create_chat_thread(db: Session, document_id: str, user_id: str, title: str) -> ThreadResponse:
     """Create a new chat thread for a document"""
     thread = ChatThread(
-        id=uuid.uuid4(),
-        document_id=uuid.UUID(document_id),
-        user_id=uuid.UUID(user_id),
+        id=uuid7(),
+        document_id=_uuid(document_id),
+        user_id=_uuid(user_id),
         title=title
     )
     
@@ -180,63 +189,51 @@ def create_chat_thread(db: Session, document_id: str, user_id: str, title: str)
     db.commit()
     db.refresh(thread)
     
-    return ThreadResponse(
-        id=str(thread.id),
-        title=thread.title,
-        createdAt=thread.created_at.isoformat(),
-        updatedAt=thread.updated_at.isoformat()
-    )
+    return ThreadResponse.from_orm_fast(thread)
+
+_THREAD_LIST_COLUMNS = (ChatThread.id, ChatThread.title, ChatThread.created_at, ChatThread.updated_at)
 
-def list_chat_threads(db: Session, document_id: str, user_id: str) -> List[ThreadResponse]:
+def _thread_list_item(row: Any) -> ThreadListItem:
+    """ThreadListItem from an (id, title, created_at, updated_at) row"""
+    return ThreadListItem(row.id, row.title, row.created_at.isoformat(), row.updated_at.isoformat())
+
+def list_chat_threads(db: Session, document_id: str, user_id: str) -> List[ThreadListItem]:
     """List chat threads for a document"""
-    threads = db.query(ChatThread)\
-        .filter(ChatThread.document_id == uuid.UUID(document_id))\
-        .filter(ChatThread.user_id == uuid.UUID(user_id))\
-        .order_by(desc(ChatThread.updated_at))\
-        .all()
+    doc_uuid = _uuid(document_id)
+    user_uuid = _uuid(user_id)
+    stmt = lambda_stmt(lambda: select(*_THREAD_LIST_COLUMNS)
+        .where(ChatThread.document_id == doc_uuid)
+        .where(ChatThread.user_id == user_uuid)
+        .order_by(desc(ChatThread.updated_at)))
+    threads = db.execute(stmt).all()
     
-    return [
-        ThreadResponse(
-            id=str(thread.id),
-            title=thread.title,
-            createdAt=thread.created_at.isoformat(),
-            updatedAt=thread.updated_at.isoformat()
-        )
-        for thread in threads
-    ]
+    return [_thread_list_item(thread) for thread in threads]
 
 def get_chat_thread_with_messages(db: Session, thread_id: str, user_id: str) -> Optional[ThreadWithMessagesResponse]:
     """Get a chat thread with its messages"""
-    thread = db.query(ChatThread)\
-        .filter(ChatThread.id == uuid.UUID(thread_id))\
-        .filter(ChatThread.user_id == uuid.UUID(user_id))\
-        .first()
+    thread_uuid = _uuid(thread_id)
+    user_uuid = _uuid(user_id)
+    
+    # One round trip: the thread comes back on every row, or once with no message for an empty thread
+    stmt = lambda_stmt(lambda: select(ChatThread, ChatMessage)
+        .outerjoin(ChatMessage, ChatMessage.thread_id == ChatThread.id)
+        .where(ChatThread.id == thread_uuid)
+        .where(ChatThread.user_id == user_uuid)
+        .order_by(ChatMessage.created_at))
+    rows = db.execute(stmt).all()
     
-    if not thread:
+    if not rows:
         return None
     
-    messages = db.query(ChatMessage)\
-        .filter(ChatMessage.thread_id == thread.id)\
-        .order_by(ChatMessage.created_at)\
-        .all()
+    thread = rows[0][0]
+    messages = [msg for _, msg in rows if msg is not None]
     
-    return ThreadWithMessagesResponse(
-        id=str(thread.id),
+    return ThreadWithMessagesResponse.model_construct(
+        id=thread.id,
         title=thread.title,
-        createdAt=thread.created_at.isoformat(),
-        updatedAt=thread.updated_at.isoformat(),
-        messages=[
-            MessageResponse(
-                id=str(msg.id),
-                role=msg.role,
-                content=msg.content,
-                pageContext=msg.page_context,
-                contextType=msg.context_type or "page",
-                chapterId=str(msg.chapter_id) if msg.chapter_id else None,
-                createdAt=msg.created_at.isoformat()
-            )
-            for msg in messages
-        ]
+        createdAt=thread.created_at,
+        updatedAt=thread.updated_at,
+        messages=[MessageResponse.from_orm_fast(msg) for msg in messages]
     )
 
 def create_chat_message(
@@ -250,177 +247,152 @@ def create_chat_message(
     context_text: Optional[str] = None
 ) -> MessageResponse:
     """Create a new chat message"""
-    message = ChatMessage(
-        id=uuid.uuid4(),
-        thread_id=uuid.UUID(thread_id),
-        role=role,
-        content=content,
-        page_context=page_context,
-        context_type=context_type,
-        chapter_id=uuid.UUID(chapter_id) if chapter_id else None,
-        context_text=context_text
-    )
+    thread_uuid = _uuid(thread_id)
     
-    db.add(message)
+    # Bump the thread's updated_at in a data-modifying CTE so both writes share one round trip
+    touch_thread = update(ChatThread)\
+        .where(ChatThread.id == thread_uuid)\
+        .values(updated_at=func.now())\
+        .cte("touch_thread")
     
-    # Update thread's updated_at timestamp
-    thread = db.query(ChatThread).filter(ChatThread.id == uuid.UUID(thread_id)).first()
-    if thread:
-        thread.updated_at = datetime.utcnow()
+    # INSERT ... RETURNING hands back the row with its server-side created_at, no refresh SELECT
+    message = db.scalars(
+        insert(ChatMessage)
+        .values(
+            id=uuid7(),
+            thread_id=thread_uuid,
+            role=role,
+            content=content,
+            page_context=page_context,
+            context_type=context_type,
+            chapter_id=_uuid(chapter_id) if chapter_id else None,
+            context_text=context_text
+        )
+        .add_cte(touch_thread)
+        .returning(ChatMessage)
+    ).one()
+    response = MessageResponse.from_orm_fast(message)
     
     db.commit()
-    db.refresh(message)
     
-    return MessageResponse(
-        id=str(message.id),
-        role=message.role,
-        content=message.content,
-        pageContext=message.page_context,
-        contextType=message.context_type,
-        chapterId=str(message.chapter_id) if message.chapter_id else None,
-        createdAt=message.created_at.isoformat()
-    )
+    return response
 
 def update_thread_title(db: Session, thread_id: str, user_id: str, title: str) -> bool:
     """Update a thread's title"""
     try:
-        thread = db.query(ChatThread)\
-            .filter(ChatThread.id == uuid.UUID(thread_id))\
-            .filter(ChatThread.user_id == uuid.UUID(user_id))\
-            .first()
-        
-        if not thread:
-            return False
-        
-        thread.title = title
-        thread.updated_at = datetime.utcnow()
+        result = db.execute(
+            update(ChatThread)
+            .where(ChatThread.id == _uuid(thread_id))
+            .where(ChatThread.user_id == _uuid(user_id))
+            .values(title=title, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
         
         db.commit()
-        return True
+        return result.rowcount > 0
     except ValueError:
         return False
 
+def _shared_access_exists(doc_uuid: uuid.UUID, user_uuid: uuid.UUID):
+    """EXISTS clause: the user has opened an active (not revoked, not expired) share of the document"""
+    return select(DocumentShareAccess.id)\
+        .join(DocumentShare, DocumentShare.id == DocumentShareAccess.share_id)\
+        .where(DocumentShare.document_id == doc_uuid)\
+        .where(DocumentShareAccess.user_id == user_uuid)\
+        .where(DocumentShare.revoked_at.is_(None))\
+        .where(or_(DocumentShare.expires_at.is_(None), DocumentShare.expires_at > func.now()))\
+        .exists()
+
 def check_user_has_document_access(db: Session, document_id: str, user_id: str) -> bool:
     """Check if user has access to document (either owns it or has shared access)"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
-        
-        # Check if user owns the document
-        owned = db.query(Document)\
-            .filter(Document.id == doc_uuid)\
-            .filter(Document.owner_id == user_uuid)\
-            .first()
-        
-        if owned:
-            return True
-        
-        # Check if user has shared access
-        shared_access = db.query(DocumentShareAccess)\
-            .join(DocumentShare, DocumentShare.id == DocumentShareAccess.share_id)\
-            .filter(DocumentShare.document_id == doc_uuid)\
-            .filter(DocumentShareAccess.user_id == user_uuid)\
-            .filter(DocumentShare.revoked_at.is_(None))\
-            .filter(
-                or_(
-                    DocumentShare.expires_at.is_(None),
-                    DocumentShare.expires_at > datetime.utcnow()
-                )
-            )\
-            .first()
-        
-        return shared_access is not None
+        return _has_document_access(db, _uuid(document_id), _uuid(user_id))
     except ValueError:
         return False
 
+def _has_document_access(db: Session, doc_uuid: uuid.UUID, user_uuid: uuid.UUID) -> bool:
+    """check_user_has_document_access for ids the caller has already parsed"""
+    # Ownership or active shared access, answered by one EXISTS-OR round trip.
+    # Runs on nearly every request, so the statement is built and compiled once.
+    stmt = lambda_stmt(lambda: select(or_(
+        select(Document.id)
+            .where(Document.id == doc_uuid)
+            .where(Document.owner_id == user_uuid)
+            .exists(),
+        _shared_access_exists(doc_uuid, user_uuid)
+    )))
+    return db.execute(stmt).scalar()
+
 def get_page_questions(db: Session, document_id: str, page_number: int, user_id: str, limit: Optional[int] = None) -> PageQuestionsResponse:
     """Get questions asked on a specific page. For shared documents, returns all questions with ownership info."""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
+        doc_uuid = _uuid(document_id)
+        user_uuid = _uuid(user_id)
         
-        # Check if user has access through sharing
-        has_shared_access = check_user_has_document_access(db, document_id, user_id)
-        
-        # Check if user owns the document
-        document = db.query(Document)\
-            .filter(Document.id == doc_uuid)\
-            .first()
-        
-        is_owner = document and document.owner_id == user_uuid
+        # Covers ownership as well as active shared access
+        has_access = _has_document_access(db, doc_uuid, user_uuid)
         
+        filters = [
+            ChatThread.document_id == doc_uuid,
+            ChatMessage.page_context == page_number,
+            ChatMessage.role == 'user'
+        ]
         # If user has shared access or owns document, show all questions
         # Otherwise, show only own questions
-        if has_shared_access or is_owner:
-            # Get all questions from all users for this page
-            total_count = db.query(ChatMessage)\
-                .join(ChatThread)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatMessage.page_context == page_number)\
-                .filter(ChatMessage.role == 'user')\
-                .count()
-            
-            query = db.query(ChatMessage, ChatThread)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatMessage.page_context == page_number)\
-                .filter(ChatMessage.role == 'user')\
-                .order_by(desc(ChatMessage.created_at))
+        if not has_access:
+            filters.append(ChatThread.user_id == user_uuid)
+        
+        # First assistant message after each question, resolved in the same query
+        answer_msg = aliased(ChatMessage)
+        answer_content = select(answer_msg.content)\
+            .where(answer_msg.thread_id == ChatMessage.thread_id)\
+            .where(answer_msg.role == 'assistant')\
+            .where(answer_msg.created_at > ChatMessage.created_at)\
+            .order_by(answer_msg.created_at)\
+            .limit(1)\
+            .correlate(ChatMessage)\
+            .scalar_subquery()
+        
+        # The window count gives the total before LIMIT in the same round trip
+        # Flat columns only; no ChatMessage/ChatThread instances are built
+        query = db.query(
+            ChatMessage.id,
+            ChatMessage.content,
+            ChatMessage.created_at,
+            ChatMessage.thread_id,
+            ChatThread.title.label('thread_title'),
+            ChatThread.user_id.label('thread_user_id'),
+            answer_content.label('answer'),
+            func.count().over().label('total')
+        )\
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
+            .filter(*filters)\
+            .order_by(desc(ChatMessage.created_at))
+        
+        questions: List[PageQuestionResponse] = []
+        total_count = 0
+        if limit == 0:
+            # Count only: skip the row query (and its answer subqueries) entirely
+            total_count = db.execute(
+                select(func.count())
+                .select_from(ChatMessage)
+                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+                .where(*filters)
+            ).scalar_one()
         else:
-            # Get only user's own questions
-            total_count = db.query(ChatMessage)\
-                .join(ChatThread)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatThread.user_id == user_uuid)\
-                .filter(ChatMessage.page_context == page_number)\
-                .filter(ChatMessage.role == 'user')\
-                .count()
-            
-            query = db.query(ChatMessage, ChatThread)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatThread.user_id == user_uuid)\
-                .filter(ChatMessage.page_context == page_number)\
-                .filter(ChatMessage.role == 'user')\
-                .order_by(desc(ChatMessage.created_at))
-        
-        # Apply limit only if specified
-        if limit is not None:
-            query = query.limit(limit)
-        
-        messages_with_threads = query.all()
-        
-        # For each question, find the first assistant response
-        questions = []
-        for msg, thread in messages_with_threads:
-            # Find the first assistant message after this user message in the same thread
-            answer_msg = db.query(ChatMessage)\
-                .filter(ChatMessage.thread_id == msg.thread_id)\
-                .filter(ChatMessage.role == 'assistant')\
-                .filter(ChatMessage.created_at > msg.created_at)\
-                .order_by(ChatMessage.created_at)\
-                .first()
-            
-            answer_content = answer_msg.content if answer_msg else None
-            question_user_id = str(thread.user_id)
-            is_own = question_user_id == user_id
-            can_open = is_own  # Can only open own threads
+            # Apply limit only if specified; an unbounded page is fetched in chunks through
+            # a server-side cursor instead of one list of every row
+            if limit is not None:
+                query = query.limit(limit)
+            else:
+                query = query.yield_per(200)
             
-            questions.append(
-                PageQuestionResponse(
-                    id=str(msg.id),
-                    threadId=str(thread.id),
-                    threadTitle=thread.title,
-                    content=msg.content,
-                    answer=answer_content,
-                    createdAt=msg.created_at.isoformat(),
-                    userId=question_user_id,
-                    isOwn=is_own,
-                    canOpenThread=can_open
-                )
-            )
+            id_cache: Dict[Any, str] = {}  # Thread/user ids repeat across questions
+            for row in query:
+                total_count = row.total
+                questions.append(PageQuestionResponse.from_row(row, user_id, id_cache))
         
-        return PageQuestionsResponse(
+        return PageQuestionsResponse.model_construct(
             pageNumber=page_number,
             totalQuestions=total_count,
             questions=questions
@@ -436,89 +408,70 @@ def get_page_questions(db: Session, document_id: str, page_number: int, user_id:
 def get_all_document_questions(db: Session, document_id: str, user_id: str) -> AllDocumentQuestionsResponse:
     """Get all questions for a document, grouped by page"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
+        doc_uuid = _uuid(document_id)
+        user_uuid = _uuid(user_id)
         
-        # Check if user has access through sharing
-        has_shared_access = check_user_has_document_access(db, document_id, user_id)
+        # Covers ownership as well as active shared access
+        has_access = _has_document_access(db, doc_uuid, user_uuid)
         
-        # Check if user owns the document
-        document = db.query(Document)\
-            .filter(Document.id == doc_uuid)\
-            .first()
-        
-        is_owner = document and document.owner_id == user_uuid
-        
-        # Get all user messages (questions) for this document
-        if has_shared_access or is_owner:
-            # Get all questions from all users
-            questions_query = db.query(ChatMessage, ChatThread)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatMessage.role == 'user')\
-                .filter(ChatMessage.page_context.isnot(None))\
-                .order_by(ChatMessage.page_context, desc(ChatMessage.created_at))
-        else:
-            # Get only user's own questions
-            questions_query = db.query(ChatMessage, ChatThread)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatThread.user_id == user_uuid)\
-                .filter(ChatMessage.role == 'user')\
-                .filter(ChatMessage.page_context.isnot(None))\
-                .order_by(ChatMessage.page_context, desc(ChatMessage.created_at))
-        
-        messages_with_threads = questions_query.all()
+        filters = [
+            ChatThread.document_id == doc_uuid,
+            ChatMessage.role == 'user',
+            ChatMessage.page_context.isnot(None)
+        ]
+        # Owners and users with shared access see all questions, others only their own
+        if not has_access:
+            filters.append(ChatThread.user_id == user_uuid)
+        
+        # First assistant message after each question, joined LATERAL so every question
+        # comes back paired with its answer in one query
+        answer_msg = aliased(ChatMessage)
+        answer = select(answer_msg.content, answer_msg.created_at)\
+            .where(answer_msg.thread_id == ChatMessage.thread_id)\
+            .where(answer_msg.role == 'assistant')\
+            .where(answer_msg.created_at > ChatMessage.created_at)\
+            .order_by(answer_msg.created_at)\
+            .limit(1)\
+            .lateral('answer')
+        
+        rows = db.execute(
+            select(
+                ChatMessage.id,
+                ChatMessage.content,
+                ChatMessage.created_at,
+                ChatMessage.thread_id,
+                ChatMessage.page_context,
+                ChatThread.title.label('thread_title'),
+                ChatThread.user_id.label('thread_user_id'),
+                answer.c.content.label('answer'),
+                answer.c.created_at.label('answer_created_at')
+            )
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .outerjoin(answer, true())
+            .where(*filters)
+            .order_by(ChatMessage.page_context, desc(ChatMessage.created_at))
+        ).all()
         
         # Group questions by page
         questions_by_page: Dict[int, List[PageQuestionResponse]] = {}
         last_modified = None
-        
-        for msg, thread in messages_with_threads:
-            page_num = msg.page_context
-            
-            # Track last modified timestamp
-            if last_modified is None or msg.created_at > last_modified:
-                last_modified = msg.created_at
-            
-            # Find the first assistant message after this user message
-            answer_msg = db.query(ChatMessage)\
-                .filter(ChatMessage.thread_id == msg.thread_id)\
-                .filter(ChatMessage.role == 'assistant')\
-                .filter(ChatMessage.created_at > msg.created_at)\
-                .order_by(ChatMessage.created_at)\
-                .first()
+        id_cache: Dict[Any, str] = {}  # Thread/user ids repeat across questions
+        
+        for row in rows:
+            # Track last modified timestamp, including answers newer than their question
+            if last_modified is None or row.created_at > last_modified:
+                last_modified = row.created_at
+            if row.answer_created_at and row.answer_created_at > last_modified:
+                last_modified = row.answer_created_at
             
-            # Update last_modified if answer is newer
-            if answer_msg and (last_modified is None or answer_msg.created_at > last_modified):
-                last_modified = answer_msg.created_at
-            
-            answer_content = answer_msg.content if answer_msg else None
-            question_user_id = str(thread.user_id)
-            is_own = question_user_id == user_id
-            can_open = is_own
-            
-            question = PageQuestionResponse(
-                id=str(msg.id),
-                threadId=str(thread.id),
-                threadTitle=thread.title,
-                content=msg.content,
-                answer=answer_content,
-                createdAt=msg.created_at.isoformat(),
-                userId=question_user_id,
-                isOwn=is_own,
-                canOpenThread=can_open
-            )
-            
-            if page_num not in questions_by_page:
-                questions_by_page[page_num] = []
-            questions_by_page[page_num].append(question)
+            question = PageQuestionResponse.from_row(row, user_id, id_cache)
+            questions_by_page.setdefault(row.page_context, []).append(question)
         
         # Convert to PageQuestionsResponse list
         pages: List[PageQuestionsResponse] = []
         for page_num in sorted(questions_by_page.keys()):
             questions = questions_by_page[page_num]
-            pages.append(PageQuestionsResponse(
+            pages.append(PageQuestionsResponse.model_construct(
                 pageNumber=page_num,
                 totalQuestions=len(questions),
                 questions=questions
@@ -526,9 +479,9 @@ def get_all_document_questions(db: Session, document_id: str, user_id: str) -> A
         
         # If no questions, return empty response with current time as lastModified
         if last_modified is None:
-            last_modified = datetime.utcnow()
+            last_modified = datetime.now(timezone.utc)
         
-        return AllDocumentQuestionsResponse(
+        return AllDocumentQuestionsResponse.model_construct(
             documentId=document_id,
             lastModified=last_modified.isoformat(),
             pages=pages
@@ -537,225 +490,273 @@ def get_all_document_questions(db: Session, document_id: str, user_id: str) -> A
         # If UUIDs are invalid, return empty response
         return AllDocumentQuestionsResponse(
             documentId=document_id,
-            lastModified=datetime.utcnow().isoformat(),
+            lastModified=datetime.now(timezone.utc).isoformat(),
             pages=[]
         )
 
 def get_document_questions_metadata(db: Session, document_id: str, user_id: str) -> DocumentQuestionsMetadataResponse:
     """Get metadata about questions for a document (lastModified, total count, pages with questions)"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
-        
-        # Check if user has access through sharing
-        has_shared_access = check_user_has_document_access(db, document_id, user_id)
-        
-        # Check if user owns the document
-        document = db.query(Document)\
-            .filter(Document.id == doc_uuid)\
-            .first()
-        
-        is_owner = document and document.owner_id == user_uuid
-        
-        # Get all user messages (questions) for this document
-        if has_shared_access or is_owner:
-            # Get all questions from all users
-            questions_query = db.query(ChatMessage)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatMessage.role == 'user')\
-                .filter(ChatMessage.page_context.isnot(None))
-            
-            # Get all messages (including answers) for lastModified
-            all_messages_query = db.query(ChatMessage)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)
-        else:
-            # Get only user's own questions
-            questions_query = db.query(ChatMessage)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatThread.user_id == user_uuid)\
-                .filter(ChatMessage.role == 'user')\
-                .filter(ChatMessage.page_context.isnot(None))
-            
-            # Get all messages (including answers) for lastModified
-            all_messages_query = db.query(ChatMessage)\
-                .join(ChatThread, ChatMessage.thread_id == ChatThread.id)\
-                .filter(ChatThread.document_id == doc_uuid)\
-                .filter(ChatThread.user_id == user_uuid)
-        
-        questions = questions_query.all()
-        all_messages = all_messages_query.all()
+        doc_uuid = _uuid(document_id)
+        user_uuid = _uuid(user_id)
+        
+        # Covers ownership as well as active shared access
+        has_access = _has_document_access(db, doc_uuid, user_uuid)
+        
+        filters = [ChatThread.document_id == doc_uuid]
+        # Owners and users with shared access see all questions, others only their own
+        if not has_access:
+            filters.append(ChatThread.user_id == user_uuid)
+        
+        # One aggregate pass over the messages instead of loading them: per page, the number
+        # of questions and the newest message (answers included, for lastModified)
+        is_question = and_(ChatMessage.role == 'user', ChatMessage.page_context.isnot(None))
+        page_stats = db.execute(
+            select(
+                ChatMessage.page_context,
+                func.count().filter(is_question).label('questions'),
+                func.max(ChatMessage.created_at).label('last_created_at')
+            )
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .where(*filters)
+            .group_by(ChatMessage.page_context)
+        ).all()
         
-        # Get last modified timestamp
-        last_modified = None
-        if all_messages:
-            last_modified = max(msg.created_at for msg in all_messages)
+        total_questions = sum(row.questions for row in page_stats)
+        last_modified = max((row.last_created_at for row in page_stats), default=None)
         
         # Get unique page numbers with questions
-        pages_with_questions = sorted(set(q.page_context for q in questions if q.page_context is not None))
+        pages_with_questions = sorted(row.page_context for row in page_stats if row.questions)
         
         # If no questions, return empty response with current time as lastModified
         if last_modified is None:
-            last_modified = datetime.utcnow()
+            last_modified = datetime.now(timezone.utc)
         
         return DocumentQuestionsMetadataResponse(
             documentId=document_id,
             lastModified=last_modified.isoformat(),
-            totalQuestions=len(questions),
+            totalQuestions=total_questions,
             pagesWithQuestions=pages_with_questions
         )
     except ValueError:
         # If UUIDs are invalid, return empty response
         return DocumentQuestionsMetadataResponse(
             documentId=document_id,
-            lastModified=datetime.utcnow().isoformat(),
+            lastModified=datetime.now(timezone.utc).isoformat(),
             totalQuestions=0,
             pagesWithQuestions=[]
         )
 
-def list_chat_threads_since(db: Session, document_id: str, user_id: str, since: Optional[datetime] = None) -> List[ThreadResponse]:
+def list_chat_threads_since(db: Session, document_id: str, user_id: str, since: Optional[datetime] = None) -> List[ThreadListItem]:
     """List chat threads for a document, optionally filtered by updated_at timestamp"""
-    query = db.query(ChatThread)\
-        .filter(ChatThread.document_id == uuid.UUID(document_id))\
-        .filter(ChatThread.user_id == uuid.UUID(user_id))
+    query = db.query(*_THREAD_LIST_COLUMNS)\
+        .filter(ChatThread.document_id == _uuid(document_id))\
+        .filter(ChatThread.user_id == _uuid(user_id))
     
     if since:
         query = query.filter(ChatThread.updated_at > since)
     
     threads = query.order_by(desc(ChatThread.updated_at)).all()
     
-    return [
-        ThreadResponse(
-            id=str(thread.id),
-            title=thread.title,
-            createdAt=thread.created_at.isoformat(),
-            updatedAt=thread.updated_at.isoformat()
-        )
-        for thread in threads
-    ]
+    return [_thread_list_item(thread) for thread in threads]
 
 def get_thread_messages_since(db: Session, thread_id: str, user_id: str, since: Optional[datetime] = None) -> Optional[ThreadWithMessagesResponse]:
     """Get a chat thread with its messages, optionally filtered by created_at timestamp"""
-    thread = db.query(ChatThread)\
-        .filter(ChatThread.id == uuid.UUID(thread_id))\
-        .filter(ChatThread.user_id == uuid.UUID(user_id))\
-        .first()
-    
-    if not thread:
-        return None
+    # Same single outer join as get_chat_thread_with_messages; the since filter sits in the
+    # ON clause so a thread with no newer messages still comes back
+    message_join = ChatMessage.thread_id == ChatThread.id
+    if since:
+        message_join = and_(message_join, ChatMessage.created_at > since)
     
-    query = db.query(ChatMessage)\
-        .filter(ChatMessage.thread_id == thread.id)
+    rows = db.query(ChatThread, ChatMessage)\
+        .outerjoin(ChatMessage, message_join)\
+        .filter(ChatThread.id == _uuid(thread_id))\
+        .filter(ChatThread.user_id == _uuid(user_id))\
+        .order_by(ChatMessage.created_at)\
+        .all()
     
-    if since:
-        query = query.filter(ChatMessage.created_at > since)
+    if not rows:
+        return None
     
-    messages = query.order_by(ChatMessage.created_at).all()
+    thread = rows[0][0]
+    messages = [msg for _, msg in rows if msg is not None]
     
-    return ThreadWithMessagesResponse(
-        id=str(thread.id),
+    return ThreadWithMessagesResponse.model_construct(
+        id=thread.id,
         title=thread.title,
-        createdAt=thread.created_at.isoformat(),
-        updatedAt=thread.updated_at.isoformat(),
-        messages=[
-            MessageResponse(
-                id=str(msg.id),
-                role=msg.role,
-                content=msg.content,
-                pageContext=msg.page_context,
-                contextType=msg.context_type or "page",
-                chapterId=str(msg.chapter_id) if msg.chapter_id else None,
-                createdAt=msg.created_at.isoformat()
-            )
-            for msg in messages
-        ]
+        createdAt=thread.created_at,
+        updatedAt=thread.updated_at,
+        messages=[MessageResponse.from_orm_fast(msg) for msg in messages]
     )
 
 # Document structure related functions
-def save_document_structure(db: Session, document_id: str, structure_items: List[Dict[str, Any]]) -> None:
+def save_document_structure(db: Session, document_id: str, structure_items: List[StructureItem]) -> None:
     """Save document structure to database"""
-    doc_uuid = uuid.UUID(document_id)
+    doc_uuid = _uuid(document_id)
     
-    # Delete existing structure
-    db.query(DocumentStructure)\
-        .filter(DocumentStructure.document_id == doc_uuid)\
-        .delete()
+    # Delete existing structure; nothing in the session holds these rows, so skip the identity-map sync
+    db.execute(
+        delete(DocumentStructure)
+        .where(DocumentStructure.document_id == doc_uuid)
+        .execution_options(synchronize_session=False)
+    )
     
-    # Build item ID map for parent relationships
-    item_ids = {}
+    if structure_items:
+        _insert_structure_rows(db, document_id, doc_uuid, structure_items)
     
-    # Create structure items
-    for item_data in structure_items:
-        parent_id = None
-        if item_data.get('parentId'):
-            parent_id = uuid.UUID(item_data['parentId'])
-        
-        structure_item = DocumentStructure(
-            id=uuid.UUID(item_data['id']) if 'id' in item_data else uuid.uuid4(),
-            document_id=doc_uuid,
-            title=item_data['title'],
-            level=item_data.get('level', 1),
-            page_from=item_data['pageFrom'],
-            page_to=item_data.get('pageTo'),
-            parent_id=parent_id,
-            order_index=item_data.get('orderIndex', 0)
+    # Delete and insert land in one transaction. Drop the cached tree only once it is committed,
+    # so a concurrent read cannot re-cache the old rows in between
+    db.commit()
+    _structure_json_cache.pop(document_id, None)
+
+def _insert_structure_rows(
+    db: Session,
+    document_id: str,
+    doc_uuid: uuid.UUID,
+    structure_items: List[StructureItem]
+) -> None:
+    """Load structure rows in one statement: COPY on psycopg2, executemany otherwise"""
+    if db.get_bind().dialect.driver != 'psycopg2':
+        # Drivers without COPY support: one Core executemany against the Table, batched by
+        # insertmanyvalues and bypassing the ORM bulk-insert layer
+        db.execute(DocumentStructure.__table__.insert(), [
+            {
+                'id': uuid.UUID(item.id),
+                'document_id': doc_uuid,
+                'title': item.title,
+                'level': item.level,
+                'page_from': item.pageFrom,
+                'page_to': item.pageTo,
+                'parent_id': uuid.UUID(item.parentId) if item.parentId else None,
+                'order_index': item.orderIndex
+            }
+            for item in structure_items
+        ])
+        return
+    
+    # Load all rows with a single COPY instead of one INSERT per item. QUOTE_ALL keeps empty
+    # titles and titles like "NULL" or "\." literal; it also quotes the '' the writer emits for
+    # None, so FORCE_NULL is what turns those back into NULL page_to / parent_id
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for item in structure_items:
+        writer.writerow((
+            item.id, document_id, item.title, item.level,
+            item.pageFrom, item.pageTo, item.parentId, item.orderIndex
+        ))
+    buffer.seek(0)
+    
+    # Raw psycopg2 cursor on the session's connection, so it shares the transaction
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY document_structure "
+            "(id, document_id, title, level, page_from, page_to, parent_id, order_index) "
+            "FROM STDIN WITH (FORMAT csv, FORCE_NULL (page_to, parent_id))",
+            buffer
         )
-        
-        db.add(structure_item)
-        item_ids[item_data['id']] = str(structure_item.id)
+
+def get_structure_items_by_checksum(
+    db: Session,
+    checksum_sha256: str,
+    exclude_document_id: str,
+    owner_id: uuid.UUID
+) -> Optional[Tuple[List[StructureItem], Optional[int]]]:
+    """Reuse the outline already extracted for a byte-identical PDF of the same owner.
+    Returns (structure items, page count) with fresh ids, or None."""
+    # Client-supplied checksums are never trusted as a source: only documents whose checksum
+    # the server computed from the stored file, and never across owners
+    source = db.query(Document.id, Document.page_count)\
+        .filter(Document.owner_id == owner_id)\
+        .filter(Document.checksum_sha256 == checksum_sha256)\
+        .filter(Document.checksum_verified.is_(True))\
+        .filter(Document.id != _uuid(exclude_document_id))\
+        .filter(
+            db.query(DocumentStructure.id)
+            .filter(DocumentStructure.document_id == Document.id)
+            .exists()
+        )\
+        .first()
+    if not source:
+        return None
     
-    db.commit()
+    rows = db.query(DocumentStructure)\
+        .filter(DocumentStructure.document_id == source.id)\
+        .order_by(DocumentStructure.order_index)\
+        .all()
+    
+    # Items become new rows, so give them new ids and remap parent links
+    new_ids = {row.id: str(uuid7()) for row in rows}
+    items = [
+        StructureItem(
+            id=new_ids[row.id],
+            title=row.title,
+            level=row.level,
+            pageFrom=row.page_from,
+            pageTo=row.page_to,
+            parentId=new_ids.get(row.parent_id),
+            orderIndex=row.order_index
+        )
+        for row in rows
+    ]
+    return items, source.page_count
+
+def build_structure_tree(rows: List[Any]) -> List[DocumentStructureItem]:
+    """Assemble flat structure rows (ordered by order_index) into a tree in one pass"""
+    # Keyed by the UUID objects themselves; no string keys are built
+    children_by_parent: Dict[Any, List[DocumentStructureItem]] = defaultdict(list)
+    id_cache: Dict[Any, str] = {}  # Each id is stringified once, as a row id or a parent id
+    root_items = []
+    
+    for row in rows:
+        item = DocumentStructureItem.from_orm_fast(row, id_cache)
+        # Share the list object so children appended later still show up
+        item.children = children_by_parent[row.id]
+        if row.parent_id is None:
+            root_items.append(item)
+        else:
+            # A list for a parent that is not in rows is simply never attached
+            children_by_parent[row.parent_id].append(item)
+    
+    return root_items
 
 def get_document_structure(db: Session, document_id: str) -> Optional[DocumentStructureResponse]:
     """Get document structure from database"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        
-        structure_items = db.query(DocumentStructure)\
-            .filter(DocumentStructure.document_id == doc_uuid)\
-            .order_by(DocumentStructure.order_index)\
-            .all()
+        doc_uuid = _uuid(document_id)
+        
+        # Plain column rows: the tree is built straight from them, no ORM instances needed
+        structure_items = db.execute(
+            select(
+                DocumentStructure.id, DocumentStructure.title, DocumentStructure.level,
+                DocumentStructure.page_from, DocumentStructure.page_to,
+                DocumentStructure.parent_id, DocumentStructure.order_index
+            )
+            .where(DocumentStructure.document_id == doc_uuid)
+            .order_by(DocumentStructure.order_index)
+        ).all()
         
         if not structure_items:
             return None
         
-        # Convert to hierarchical structure
-        items_map: Dict[str, DocumentStructureItem] = {}
-        root_items = []
-        
-        # First pass: create all items
-        for item in structure_items:
-            pydantic_item = DocumentStructureItem(
-                id=str(item.id),
-                title=item.title,
-                level=item.level,
-                pageFrom=item.page_from,
-                pageTo=item.page_to,
-                parentId=str(item.parent_id) if item.parent_id else None,
-                orderIndex=item.order_index,
-                children=[]
-            )
-            items_map[str(item.id)] = pydantic_item
-        
-        # Second pass: build hierarchy
-        for item in structure_items:
-            pydantic_item = items_map[str(item.id)]
-            if item.parent_id:
-                parent_item = items_map.get(str(item.parent_id))
-                if parent_item:
-                    parent_item.children.append(pydantic_item)
-            else:
-                root_items.append(pydantic_item)
+        root_items = build_structure_tree(structure_items)
         
-        return DocumentStructureResponse(
+        return DocumentStructureResponse.model_construct(
             documentId=document_id,
             items=root_items
         )
     except ValueError:
         return None
 
+def get_document_structure_json(db: Session, document_id: str) -> Optional[bytes]:
+    """Document structure as ready-to-send JSON bytes, cached briefly per document"""
+    payload = _structure_json_cache.get(document_id)
+    if payload is None:
+        structure = get_document_structure(db, document_id)
+        if not structure:
+            return None
+        payload = _structure_json_cache[document_id] = structure.to_json()
+    return payload
+
 def get_chapter_by_page(
     db: Session, 
     document_id: str, 
@@ -765,23 +766,18 @@ def get_chapter_by_page(
 ) -> Optional[DocumentStructure]:
     """Find which chapter/section contains a given page with optional level filtering"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        
-        # Find structure items within level range
-        structure_items = db.query(DocumentStructure)\
-            .filter(DocumentStructure.document_id == doc_uuid)\
-            .filter(DocumentStructure.page_from <= page_number)\
-            .filter(DocumentStructure.level >= min_level)\
-            .filter(DocumentStructure.level <= max_level)\
-            .order_by(DocumentStructure.level.desc(), DocumentStructure.order_index)\
-            .all()
-        
-        for item in structure_items:
-            # Check if page is within range
-            if item.page_to is None or page_number <= item.page_to:
-                return item
-        
-        return None
+        doc_uuid = _uuid(document_id)
+        
+        # Deepest structure item within the level range whose page range contains the page
+        stmt = lambda_stmt(lambda: select(DocumentStructure)
+            .where(DocumentStructure.document_id == doc_uuid)
+            .where(DocumentStructure.page_from <= page_number)
+            .where(or_(DocumentStructure.page_to.is_(None), DocumentStructure.page_to >= page_number))
+            .where(DocumentStructure.level >= min_level)
+            .where(DocumentStructure.level <= max_level)
+            .order_by(DocumentStructure.level.desc(), DocumentStructure.order_index)
+            .limit(1))
+        return db.execute(stmt).scalars().first()
     except ValueError:
         return None
 
@@ -793,23 +789,21 @@ def get_nearest_chapter(
 ) -> Optional[DocumentStructure]:
     """Find nearest chapter/section at a specific level containing the page"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        
-        # First try to find exact level
-        structure_items = db.query(DocumentStructure)\
-            .filter(DocumentStructure.document_id == doc_uuid)\
-            .filter(DocumentStructure.page_from <= page_number)\
-            .filter(DocumentStructure.level == target_level)\
-            .order_by(DocumentStructure.order_index)\
-            .all()
-        
-        for item in structure_items:
-            if item.page_to is None or page_number <= item.page_to:
-                return item
-        
-        # If not found at exact level, return the first available structure
-        fallback = get_chapter_by_page(db, document_id, page_number)
-        return fallback
+        doc_uuid = _uuid(document_id)
+        
+        # Prefer the target level; otherwise fall back to the deepest item containing the page,
+        # both in one query
+        stmt = lambda_stmt(lambda: select(DocumentStructure)
+            .where(DocumentStructure.document_id == doc_uuid)
+            .where(DocumentStructure.page_from <= page_number)
+            .where(or_(DocumentStructure.page_to.is_(None), DocumentStructure.page_to >= page_number))
+            .order_by(
+                (DocumentStructure.level == target_level).desc(),
+                DocumentStructure.level.desc(),
+                DocumentStructure.order_index
+            )
+            .limit(1))
+        return db.execute(stmt).scalars().first()
         
     except ValueError:
         return None
@@ -822,19 +816,19 @@ def update_chat_message_context(
 ) -> bool:
     """Update chat message context information"""
     try:
-        message = db.query(ChatMessage)\
-            .filter(ChatMessage.id == uuid.UUID(message_id))\
-            .first()
-        
-        if not message:
-            return False
-        
-        message.context_type = context_type
+        values = {"context_type": context_type}
         if chapter_id:
-            message.chapter_id = uuid.UUID(chapter_id)
+            values["chapter_id"] = _uuid(chapter_id)
+        
+        result = db.execute(
+            update(ChatMessage)
+            .where(ChatMessage.id == _uuid(message_id))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
         
         db.commit()
-        return True
+        return result.rowcount > 0
     except ValueError:
         return False
 
@@ -842,123 +836,186 @@ def update_chat_message_context(
 def get_user_plan(db: Session, user_id: str) -> Optional[UserPlan]:
     """Get the current active plan for a user"""
     try:
-        user_uuid = uuid.UUID(user_id)
-        # Get the most recent active plan
-        plan = db.query(UserPlan)\
-            .filter(UserPlan.user_id == user_uuid)\
-            .filter(UserPlan.status == 'active')\
-            .order_by(desc(UserPlan.started_at))\
-            .first()
-        
-        return plan
+        user_uuid = _uuid(user_id)
+        # Get the most recent active plan; runs on every usage check, so the statement is cached
+        stmt = lambda_stmt(lambda: select(UserPlan)
+            .where(UserPlan.user_id == user_uuid)
+            .where(UserPlan.status == 'active')
+            .order_by(desc(UserPlan.started_at))
+            .limit(1))
+        return db.execute(stmt).scalars().first()
     except ValueError:
         return None
 
 def set_user_plan(db: Session, user_id: str, plan_type: str) -> UserPlan:
     """Set or change a user's plan. Deactivates old plan and creates a new one."""
     try:
-        user_uuid = uuid.UUID(user_id)
+        user_uuid = _uuid(user_id)
         
         # Deactivate existing active plan
-        existing_plans = db.query(UserPlan)\
-            .filter(UserPlan.user_id == user_uuid)\
-            .filter(UserPlan.status == 'active')\
-            .all()
-        
-        for plan in existing_plans:
-            plan.status = 'expired'
-            plan.updated_at = datetime.utcnow()
+        db.execute(
+            update(UserPlan)
+            .where(UserPlan.user_id == user_uuid)
+            .where(UserPlan.status == 'active')
+            .values(status='expired', updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
         
-        # Create new plan
+        # Create new plan (started_at defaults to now() on the server)
         new_plan = UserPlan(
-            id=uuid.uuid4(),
+            id=uuid7(),
             user_id=user_uuid,
             plan_type=plan_type,
-            status='active',
-            started_at=datetime.utcnow()
+            status='active'
         )
         
         db.add(new_plan)
         db.commit()
         db.refresh(new_plan)
+        _user_usage_cache.pop(user_id, None)
         
         return new_plan
     except ValueError:
         raise ValueError("Invalid user_id or plan_type")
 
-def get_plan_limits(db: Session, plan_type: str) -> Optional[PlanLimits]:
-    """Get limits for a specific plan type"""
-    return db.query(PlanLimits)\
+def get_plan_limits(db: Session, plan_type: str) -> Optional[PlanLimitsResponse]:
+    """Get limits for a specific plan type, cached briefly per plan type"""
+    limits_response = _plan_limits_cache.get(plan_type)
+    if limits_response is not None:
+        return limits_response
+    
+    limits = db.query(PlanLimits)\
         .filter(PlanLimits.plan_type == plan_type)\
         .first()
+    if not limits:
+        return None
+    
+    # Cache the detached response model, not the session-bound row
+    limits_response = _plan_limits_cache[plan_type] = PlanLimitsResponse(
+        planType=limits.plan_type,
+        maxStorageBytes=limits.max_storage_bytes,
+        maxFiles=limits.max_files,
+        maxSingleFileBytes=limits.max_single_file_bytes,
+        maxTokensPerMonth=limits.max_tokens_per_month,
+        maxQuestionsPerMonth=limits.max_questions_per_month
+    )
+    return limits_response
+
+def invalidate_plan_limits(plan_type: Optional[str] = None) -> None:
+    """Drop cached limits for one plan type, or all of them, after plan_limits changes"""
+    if plan_type is None:
+        _plan_limits_cache.clear()
+    else:
+        _plan_limits_cache.pop(plan_type, None)
 
+@lru_cache(maxsize=4096)
 def calculate_period_dates(start_date: date) -> tuple[date, date]:
     """Calculate period start and end dates based on subscription start date.
     Period resets monthly on the same day of month as the subscription started.
     Returns (period_start, period_end) where period_end is the last day of the period.
     """
-    period_start = start_date
+    # Same day next month, clamped to that month's length, minus 1 day (inclusive end)
+    year, month = _add_months(start_date.year, start_date.month, 1)
+    day = min(start_date.day, calendar.monthrange(year, month)[1])
+    return start_date, date(year, month, day) - timedelta(days=1)
+
+def _add_months(year: int, month: int, months: int) -> tuple[int, int]:
+    """(year, month) shifted by a number of months"""
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+def current_period_start(plan_start: date, today: date) -> date:
+    """Start of the usage period containing `today`, in constant time.
+    Matches chaining calculate_period_dates from the plan start: each period starts
+    on the plan's day of month, clamped to every month passed so far, so a plan
+    started on the 31st settles on the 28th after its first February."""
+    months = (today.year - plan_start.year) * 12 + today.month - plan_start.month
+    if months <= 0:
+        return plan_start
     
-    # Calculate period_end: same day next month minus 1 day (inclusive end)
-    if period_start.month == 12:
-        try:
-            period_end = date(period_start.year + 1, 1, period_start.day) - timedelta(days=1)
-        except ValueError:
-            period_end = date(period_start.year, 12, 31)
-    else:
-        try:
-            period_end = date(period_start.year, period_start.month + 1, period_start.day) - timedelta(days=1)
-        except ValueError:
-            # Handle cases where the day doesn't exist in next month (e.g., Jan 31 -> Feb)
-            # Use last day of the next month
-            if period_start.month + 1 == 2:
-                # February: use 28 (or 29 in leap year)
-                if period_start.year % 4 == 0 and (period_start.year % 100 != 0 or period_start.year % 400 == 0):
-                    period_end = date(period_start.year, 2, 29) - timedelta(days=1)
-                else:
-                    period_end = date(period_start.year, 2, 28) - timedelta(days=1)
-            else:
-                # Get last day of current month
-                if period_start.month + 1 in [4, 6, 9, 11]:
-                    period_end = date(period_start.year, period_start.month + 1, 30) - timedelta(days=1)
-                else:
-                    period_end = date(period_start.year, period_start.month + 1, 31) - timedelta(days=1)
+    def start_of(k: int) -> date:
+        year, month = _add_months(plan_start.year, plan_start.month, k)
+        day = plan_start.day
+        # Only days past the 28th can be clamped; within four years the day reaches 28
+        i = 1
+        while day > 28 and i <= min(k, 48):
+            y, m = _add_months(plan_start.year, plan_start.month, i)
+            day = min(day, calendar.monthrange(y, m)[1])
+            i += 1
+        return date(year, month, day)
     
-    return period_start, period_end
+    period_start = start_of(months)
+    if period_start > today:
+        period_start = start_of(months - 1)
+    return period_start
 
 def get_or_create_user_usage(db: Session, user_id: str, plan_id: str) -> UserUsage:
     """Get or create user usage record for current period based on plan start date"""
     try:
-        user_uuid = uuid.UUID(user_id)
-        plan_uuid = uuid.UUID(plan_id)
+        user_uuid = _uuid(user_id)
+        plan_uuid = _uuid(plan_id)
         
         # Get the plan to determine period dates
         plan = db.query(UserPlan).filter(UserPlan.id == plan_uuid).first()
         if not plan:
             raise ValueError("Plan not found")
         
-        # Calculate current period based on plan start date
-        plan_start_date = plan.started_at.date()
-        current_date = date.today()
-        
-        # Find the period that contains today's date
-        # Periods reset monthly on the same day as the plan started
-        period_start = plan_start_date
-        
-        # If today is past the first period end, calculate the correct period
-        while True:
-            _, period_end = calculate_period_dates(period_start)
-            if current_date <= period_end:
-                break
-            # Move to next period
-            period_start = period_end + timedelta(days=1)
-        
-        # Try to get existing usage record (unique constraint is on user_id + period_start)
+        return _get_or_create_usage_for_plan(db, user_uuid, plan)
+    except ValueError as e:
+        raise ValueError(f"Invalid user_id or plan_id: {e}")
+
+def _get_or_create_usage_for_plan(db: Session, user_uuid: uuid.UUID, plan: UserPlan) -> UserUsage:
+    """get_or_create_user_usage for a plan the caller has already loaded"""
+    plan_uuid = plan.id
+    
+    # Calculate current period based on plan start date
+    plan_start_date = plan.started_at.date()
+    current_date = date.today()
+    
+    # Find the period that contains today's date
+    # Periods reset monthly on the same day as the plan started
+    period_start = current_period_start(plan_start_date, current_date)
+    
+    # Try to get existing usage record (unique constraint is on user_id + period_start)
+    usage = db.query(UserUsage)\
+        .filter(UserUsage.user_id == user_uuid)\
+        .filter(UserUsage.period_start == period_start)\
+        .first()
+    
+    if usage:
+        # If plan_id changed, update it
+        if usage.plan_id != plan_uuid:
+            usage.plan_id = plan_uuid
+            db.commit()
+            db.refresh(usage)
+        return usage
+    
+    # Create new usage record
+    _, period_end = calculate_period_dates(period_start)
+    usage = UserUsage(
+        id=uuid7(),
+        user_id=user_uuid,
+        plan_id=plan_uuid,
+        period_start=period_start,
+        period_end=period_end,
+        storage_bytes_used=0,
+        files_count=0,
+        tokens_used=0,
+        questions_count=0
+    )
+    
+    db.add(usage)
+    try:
+        db.commit()
+        db.refresh(usage)
+    except Exception as e:
+        db.rollback()
+        # If there was a race condition and record was created by another thread,
+        # try to fetch it again
         usage = db.query(UserUsage)\
             .filter(UserUsage.user_id == user_uuid)\
             .filter(UserUsage.period_start == period_start)\
             .first()
-        
         if usage:
             # If plan_id changed, update it
             if usage.plan_id != plan_uuid:
@@ -966,48 +1023,15 @@ def get_or_create_user_usage(db: Session, user_id: str, plan_id: str) -> UserUsa
                 db.commit()
                 db.refresh(usage)
             return usage
-        
-        # Create new usage record
-        _, period_end = calculate_period_dates(period_start)
-        usage = UserUsage(
-            id=uuid.uuid4(),
-            user_id=user_uuid,
-            plan_id=plan_uuid,
-            period_start=period_start,
-            period_end=period_end,
-            storage_bytes_used=0,
-            files_count=0,
-            tokens_used=0,
-            questions_count=0
-        )
-        
-        db.add(usage)
-        try:
-            db.commit()
-            db.refresh(usage)
-        except Exception as e:
-            db.rollback()
-            # If there was a race condition and record was created by another thread,
-            # try to fetch it again
-            usage = db.query(UserUsage)\
-                .filter(UserUsage.user_id == user_uuid)\
-                .filter(UserUsage.period_start == period_start)\
-                .first()
-            if usage:
-                # If plan_id changed, update it
-                if usage.plan_id != plan_uuid:
-                    usage.plan_id = plan_uuid
-                    db.commit()
-                    db.refresh(usage)
-                return usage
-            raise
-        
-        return usage
-    except ValueError as e:
-        raise ValueError(f"Invalid user_id or plan_id: {e}")
+        raise
+    
+    return usage
 
 def get_user_usage(db: Session, user_id: str) -> Optional[UserUsageResponse]:
     """Get current user usage with limits"""
+    cached = _user_usage_cache.get(user_id)
+    if cached is not None:
+        return cached
     try:
         # Get user's active plan
         plan = get_user_plan(db, user_id)
@@ -1016,24 +1040,14 @@ def get_user_usage(db: Session, user_id: str) -> Optional[UserUsageResponse]:
             plan = set_user_plan(db, user_id, 'beta')
         
         # Get or create usage record
-        usage = get_or_create_user_usage(db, user_id, str(plan.id))
+        usage = _get_or_create_usage_for_plan(db, _uuid(user_id), plan)
         
         # Get plan limits
-        limits = get_plan_limits(db, plan.plan_type)
-        if not limits:
+        limits_response = get_plan_limits(db, plan.plan_type)
+        if not limits_response:
             return None
         
-        # Convert to response model
-        limits_response = PlanLimitsResponse(
-            planType=limits.plan_type,
-            maxStorageBytes=limits.max_storage_bytes,
-            maxFiles=limits.max_files,
-            maxSingleFileBytes=limits.max_single_file_bytes,
-            maxTokensPerMonth=limits.max_tokens_per_month,
-            maxQuestionsPerMonth=limits.max_questions_per_month
-        )
-        
-        return UserUsageResponse(
+        usage_data = _user_usage_cache[user_id] = UserUsageResponse(
             userId=str(usage.user_id),
             planId=str(usage.plan_id),
             planType=plan.plan_type,
@@ -1045,6 +1059,7 @@ def get_user_usage(db: Session, user_id: str) -> Optional[UserUsageResponse]:
             questionsCount=usage.questions_count,
             limits=limits_response
         )
+        return usage_data
     except ValueError:
         return None
 
@@ -1058,85 +1073,161 @@ def increment_user_usage(
 ) -> bool:
     """Increment user usage counters"""
     try:
+        user_uuid = _uuid(user_id)
+        
         # Get user's active plan
         plan = get_user_plan(db, user_id)
         if not plan:
             plan = set_user_plan(db, user_id, 'beta')
         
-        # Get or create usage record
-        usage = get_or_create_user_usage(db, user_id, str(plan.id))
-        
-        # Increment counters
-        if storage_bytes != 0:
-            usage.storage_bytes_used = max(0, usage.storage_bytes_used + storage_bytes)
-        if files != 0:
-            usage.files_count = max(0, usage.files_count + files)
-        if tokens != 0:
-            usage.tokens_used = max(0, usage.tokens_used + tokens)
-        if questions != 0:
-            usage.questions_count = max(0, usage.questions_count + questions)
+        period_start = current_period_start(plan.started_at.date(), date.today())
+        _, period_end = calculate_period_dates(period_start)
         
-        usage.updated_at = datetime.utcnow()
+        stmt = usage_increment_statement(
+            user_uuid, plan.id, period_start, period_end,
+            storage_bytes=storage_bytes, files=files, tokens=tokens, questions=questions
+        )
         
+        db.execute(stmt)
         db.commit()
+        _user_usage_cache.pop(user_id, None)
         return True
     except ValueError:
         return False
 
-def check_storage_limit(db: Session, user_id: str, file_size: int) -> tuple[bool, Optional[str]]:
-    """Check if user can upload a file of given size. Returns (allowed, error_message)"""
-    usage_data = get_user_usage(db, user_id)
-    if not usage_data:
-        return False, "Unable to determine usage limits"
+def usage_increment_statement(
+    user_uuid: uuid.UUID,
+    plan_id: uuid.UUID,
+    period_start: date,
+    period_end: date,
+    storage_bytes: int = 0,
+    files: int = 0,
+    tokens: int = 0,
+    questions: int = 0
+):
+    """The usage counter upsert for one period, for callers that run it on their own session"""
+    # One atomic upsert on (user_id, period_start): creates the period's row on first use,
+    # otherwise adds to the counters in place, so concurrent increments can't lose updates
+    def bumped(column, delta: int):
+        return func.greatest(0, func.coalesce(column, 0) + delta)
     
+    return pg_insert(UserUsage).values(
+        id=uuid7(),
+        user_id=user_uuid,
+        plan_id=plan_id,
+        period_start=period_start,
+        period_end=period_end,
+        storage_bytes_used=max(0, storage_bytes),
+        files_count=max(0, files),
+        tokens_used=max(0, tokens),
+        questions_count=max(0, questions)
+    ).on_conflict_do_update(
+        index_elements=[UserUsage.user_id, UserUsage.period_start],
+        set_={
+            'plan_id': plan_id,
+            'storage_bytes_used': bumped(UserUsage.storage_bytes_used, storage_bytes),
+            'files_count': bumped(UserUsage.files_count, files),
+            'tokens_used': bumped(UserUsage.tokens_used, tokens),
+            'questions_count': bumped(UserUsage.questions_count, questions),
+            'updated_at': func.now()
+        }
+    )
+
+def invalidate_user_usage(user_id: str) -> None:
+    """Drop the cached usage snapshot after counters changed outside increment_user_usage"""
+    _user_usage_cache.pop(user_id, None)
+
+def _storage_allowed(usage_data: UserUsageResponse, file_size: int) -> tuple[bool, Optional[str]]:
     if usage_data.storageBytesUsed + file_size > usage_data.limits.maxStorageBytes:
         max_mb = usage_data.limits.maxStorageBytes / (1024 * 1024)
         used_mb = usage_data.storageBytesUsed / (1024 * 1024)
         return False, f"Storage limit exceeded. Maximum: {max_mb:.1f} MB, Used: {used_mb:.1f} MB"
-    
     return True, None
 
-def check_file_count_limit(db: Session, user_id: str) -> tuple[bool, Optional[str]]:
-    """Check if user can upload another file. Returns (allowed, error_message)"""
-    usage_data = get_user_usage(db, user_id)
-    if not usage_data:
-        return False, "Unable to determine usage limits"
-    
+def _file_count_allowed(usage_data: UserUsageResponse) -> tuple[bool, Optional[str]]:
     # NULL means unlimited
     if usage_data.limits.maxFiles is None:
         return True, None
-    
     if usage_data.filesCount >= usage_data.limits.maxFiles:
         return False, f"File limit exceeded. Maximum: {usage_data.limits.maxFiles} files"
-    
     return True, None
 
-def check_single_file_limit(db: Session, user_id: str, file_size: int) -> tuple[bool, Optional[str]]:
-    """Check if single file size is within limit. Returns (allowed, error_message)"""
-    usage_data = get_user_usage(db, user_id)
-    if not usage_data:
-        return False, "Unable to determine usage limits"
-    
+def _single_file_allowed(usage_data: UserUsageResponse, file_size: int) -> tuple[bool, Optional[str]]:
     if file_size > usage_data.limits.maxSingleFileBytes:
         max_mb = usage_data.limits.maxSingleFileBytes / (1024 * 1024)
         return False, f"File size exceeds limit. Maximum: {max_mb:.1f} MB"
+    return True, None
+
+def check_upload_limits(
+    db: Session,
+    user_id: str,
+    file_size: int,
+    usage_data: Optional[UserUsageResponse] = None
+) -> tuple[bool, Optional[str]]:
+    """Check single file size, storage and file count limits against one usage lookup.
+    Returns (allowed, error_message) for the first limit that fails."""
+    if usage_data is None:
+        usage_data = get_user_usage(db, user_id)
+    if not usage_data:
+        return False, "Unable to determine usage limits"
     
+    for allowed, error_msg in (
+        _single_file_allowed(usage_data, file_size),
+        _storage_allowed(usage_data, file_size),
+        _file_count_allowed(usage_data),
+    ):
+        if not allowed:
+            return allowed, error_msg
     return True, None
 
-def check_tokens_limit(db: Session, user_id: str, tokens_needed: int) -> tuple[bool, Optional[str]]:
-    """Check if user can use more tokens. Returns (allowed, error_message)"""
+def check_storage_limit(db: Session, user_id: str, file_size: int) -> tuple[bool, Optional[str]]:
+    """Check if user can upload a file of given size. Returns (allowed, error_message)"""
     usage_data = get_user_usage(db, user_id)
     if not usage_data:
         return False, "Unable to determine usage limits"
+    return _storage_allowed(usage_data, file_size)
+
+def check_file_count_limit(db: Session, user_id: str) -> tuple[bool, Optional[str]]:
+    """Check if user can upload another file. Returns (allowed, error_message)"""
+    usage_data = get_user_usage(db, user_id)
+    if not usage_data:
+        return False, "Unable to determine usage limits"
+    return _file_count_allowed(usage_data)
+
+def check_single_file_limit(db: Session, user_id: str, file_size: int) -> tuple[bool, Optional[str]]:
+    """Check if single file size is within limit. Returns (allowed, error_message)"""
+    usage_data = get_user_usage(db, user_id)
+    if not usage_data:
+        return False, "Unable to determine usage limits"
+    return _single_file_allowed(usage_data, file_size)
+
+def check_tokens_limit(
+    db: Session,
+    user_id: str,
+    tokens_needed: int,
+    usage_data: Optional[UserUsageResponse] = None
+) -> tuple[bool, Optional[str]]:
+    """Check if user can use more tokens. Returns (allowed, error_message).
+    Pass usage_data when the request has already loaded it to skip the usage lookup."""
+    if usage_data is None:
+        usage_data = get_user_usage(db, user_id)
+    if not usage_data:
+        return False, "Unable to determine usage limits"
     
     if usage_data.tokensUsed + tokens_needed > usage_data.limits.maxTokensPerMonth:
         return False, f"Token limit exceeded. Maximum: {usage_data.limits.maxTokensPerMonth} tokens"
     
     return True, None
 
-def check_questions_limit(db: Session, user_id: str) -> tuple[bool, Optional[str]]:
-    """Check if user can ask another question. Returns (allowed, error_message)"""
-    usage_data = get_user_usage(db, user_id)
+def check_questions_limit(
+    db: Session,
+    user_id: str,
+    usage_data: Optional[UserUsageResponse] = None
+) -> tuple[bool, Optional[str]]:
+    """Check if user can ask another question. Returns (allowed, error_message).
+    Pass usage_data when the request has already loaded it to skip the usage lookup."""
+    if usage_data is None:
+        usage_data = get_user_usage(db, user_id)
     if not usage_data:
         return False, "Unable to determine usage limits"
     
@@ -1148,49 +1239,47 @@ def check_questions_limit(db: Session, user_id: str) -> tuple[bool, Optional[str
 # Document sharing related repository functions
 def create_document_share(db: Session, document_id: str, user_id: str, expires_at: Optional[datetime] = None) -> DocumentShare:
     """Create a new share for a document"""
-    # Generate unique token (32 bytes = 64 hex characters)
-    share_token = secrets.token_urlsafe(32)
-    
-    # Ensure uniqueness
-    while db.query(DocumentShare).filter(DocumentShare.share_token == share_token).first():
-        share_token = secrets.token_urlsafe(32)
-    
-    share = DocumentShare(
-        id=uuid.uuid4(),
-        document_id=uuid.UUID(document_id),
-        share_token=share_token,
-        created_by=uuid.UUID(user_id),
-        expires_at=expires_at
-    )
-    
-    db.add(share)
-    db.commit()
-    db.refresh(share)
-    
-    return share
+    # 256-bit tokens practically never collide, so skip the lookup and let the UNIQUE
+    # constraint on share_token catch the rare clash; retry with a fresh token then
+    for attempt in range(3):
+        share = DocumentShare(
+            id=uuid7(),
+            document_id=_uuid(document_id),
+            # 32 bytes of randomness, URL-safe base64
+            share_token=secrets.token_urlsafe(32),
+            created_by=_uuid(user_id),
+            expires_at=expires_at
+        )
+        
+        db.add(share)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            if attempt == 2:
+                raise
+            continue
+        db.refresh(share)
+        
+        return share
 
 def get_document_share_by_token(db: Session, share_token: str) -> Optional[DocumentShare]:
     """Get a document share by token, checking validity"""
-    share = db.query(DocumentShare)\
-        .filter(DocumentShare.share_token == share_token)\
+    # Revocation and expiry are checked by the database clock, like the access filters
+    return db.query(DocumentShare)\
+        .filter(
+            DocumentShare.share_token == share_token,
+            DocumentShare.revoked_at.is_(None),
+            or_(
+                DocumentShare.expires_at.is_(None),
+                DocumentShare.expires_at > func.now()
+            )
+        )\
         .first()
-    
-    if not share:
-        return None
-    
-    # Check if revoked
-    if share.revoked_at:
-        return None
-    
-    # Check if expired
-    if share.expires_at and share.expires_at < datetime.utcnow():
-        return None
-    
-    return share
 
 def get_active_document_share(db: Session, document_id: str) -> Optional[DocumentShare]:
     """Get active share for a document (not revoked, not expired)"""
-    doc_uuid = uuid.UUID(document_id)
+    doc_uuid = _uuid(document_id)
     
     share = db.query(DocumentShare)\
         .filter(DocumentShare.document_id == doc_uuid)\
@@ -1198,7 +1287,7 @@ def get_active_document_share(db: Session, document_id: str) -> Optional[Documen
         .filter(
             or_(
                 DocumentShare.expires_at.is_(None),
-                DocumentShare.expires_at > datetime.utcnow()
+                DocumentShare.expires_at > func.now()
             )
         )\
         .order_by(desc(DocumentShare.created_at))\
@@ -1209,8 +1298,8 @@ def get_active_document_share(db: Session, document_id: str) -> Optional[Documen
 def revoke_document_share(db: Session, document_id: str, user_id: str) -> bool:
     """Revoke a document share (set revoked_at to current time)"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
+        doc_uuid = _uuid(document_id)
+        user_uuid = _uuid(user_id)
         
         share = db.query(DocumentShare)\
             .filter(DocumentShare.document_id == doc_uuid)\
@@ -1221,7 +1310,7 @@ def revoke_document_share(db: Session, document_id: str, user_id: str) -> bool:
         if not share:
             return False
         
-        share.revoked_at = datetime.utcnow()
+        share.revoked_at = func.now()
         db.commit()
         return True
     except ValueError:
@@ -1230,53 +1319,36 @@ def revoke_document_share(db: Session, document_id: str, user_id: str) -> bool:
 def record_share_access(db: Session, share_id: str, user_id: str) -> bool:
     """Record that a user accessed a shared document. Returns True if new record created, False if already exists."""
     try:
-        share_uuid = uuid.UUID(share_id)
-        user_uuid = uuid.UUID(user_id)
-        
-        # Check if access record already exists
-        existing = db.query(DocumentShareAccess)\
-            .filter(DocumentShareAccess.share_id == share_uuid)\
-            .filter(DocumentShareAccess.user_id == user_uuid)\
-            .first()
-        
-        if existing:
-            return False  # Already recorded
-        
-        # Create new access record
-        access = DocumentShareAccess(
-            id=uuid.uuid4(),
-            share_id=share_uuid,
-            user_id=user_uuid
+        share_uuid = _uuid(share_id)
+        user_uuid = _uuid(user_id)
+        
+        # Insert-or-skip on UNIQUE(share_id, user_id): one round trip, no check-then-insert race.
+        # RETURNING yields a row only when a new record was created.
+        result = db.execute(
+            pg_insert(DocumentShareAccess)
+            .values(id=uuid7(), share_id=share_uuid, user_id=user_uuid)
+            .on_conflict_do_nothing(index_elements=[DocumentShareAccess.share_id, DocumentShareAccess.user_id])
+            .returning(DocumentShareAccess.id)
         )
-        
-        db.add(access)
+        created = result.scalar() is not None
         db.commit()
-        return True
+        return created
     except ValueError:
         return False
 
 def get_document_by_id_or_share(db: Session, document_id: str, user_id: str) -> Optional[Document]:
     """Get a document by ID, checking ownership or shared access"""
     try:
-        doc_uuid = uuid.UUID(document_id)
-        user_uuid = uuid.UUID(user_id)
+        doc_uuid = _uuid(document_id)
+        user_uuid = _uuid(user_id)
         
-        # Try to get document
-        document = db.query(Document)\
+        # Ownership and active shared access are checked in the same query as the fetch
+        return db.query(Document)\
             .filter(Document.id == doc_uuid)\
+            .filter(or_(
+                Document.owner_id == user_uuid,
+                _shared_access_exists(doc_uuid, user_uuid)
+            ))\
             .first()
-        
-        if not document:
-            return None
-        
-        # Check ownership
-        if document.owner_id == user_uuid:
-            return document
-        
-        # Check shared access
-        if check_user_has_document_access(db, document_id, user_id):
-            return document
-        
-        return None
     except ValueError:
         return None
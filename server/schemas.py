@@ -0,0 +1,334 @@
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer
+import msgspec
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Annotated, Any, Dict, Optional, List, Literal
+
+if TYPE_CHECKING:
+    from models import ChatMessage, ChatThread, Document, DocumentStructure
+
+def uuid_str(value: Any, cache: Optional[Dict[Any, str]] = None) -> Optional[str]:
+    """str() of a UUID, memoized in `cache` for ids that repeat across rows
+    (thread, user and parent ids). The canonical hyphenated form is kept."""
+    if value is None:
+        return None
+    if cache is None:
+        return str(value)
+    text = cache.get(value)
+    if text is None:
+        text = cache[value] = str(value)
+    return text
+
+# Timestamps keep isoformat() on the wire ("+00:00", not the serializers' "Z"), like the
+# endpoints that still build their timestamp strings by hand
+IsoDatetime = Annotated[datetime, PlainSerializer(datetime.isoformat, return_type=str, when_used='json')]
+
+# Pydantic models for API requests/responses
+class JSONResponseModel(BaseModel):
+    """Response model that can serialize itself straight to JSON bytes"""
+    
+    def to_json(self) -> bytes:
+        """Serialize with the compiled pydantic-core serializer, skipping FastAPI's
+        jsonable_encoder and response_model re-validation"""
+        return self.__pydantic_serializer__.to_json(self, by_alias=True)
+
+class CreateDocumentRequest(BaseModel):
+    title: Optional[str] = None
+    storage_key: str = Field(alias="storageKey")
+    size_bytes: int = Field(alias="sizeBytes")
+    mime: str
+    checksum_sha256: Optional[str] = Field(None, alias="checksumSha256")
+    
+    model_config = ConfigDict(populate_by_name=True)  # Allow both snake_case and camelCase
+
+class DocumentResponse(BaseModel):
+    id: str
+    title: Optional[str] = None
+    storageKey: str
+    sizeBytes: Optional[int]
+    mime: Optional[str] = None
+    status: str
+    createdAt: str
+    lastViewedPage: Optional[int] = None
+    isShared: Optional[bool] = False  # True if document is shared (not owned by current user)
+    hasActiveShare: Optional[bool] = False  # True if document has an active share link (created by current user)
+    questionsCount: Optional[int] = 0  # Number of questions asked for this document
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
+    @classmethod
+    def from_orm_fast(cls, doc: "Document", **extra) -> "DocumentResponse":
+        """Build from a trusted ORM row without running validation"""
+        return cls.model_construct(
+            id=str(doc.id),
+            title=doc.title,
+            storageKey=doc.storage_key,
+            sizeBytes=doc.size_bytes,
+            mime=doc.mime,
+            status=doc.status,
+            createdAt=doc.created_at.isoformat(),
+            lastViewedPage=doc.last_viewed_page,
+            **extra
+        )
+
+class DocumentListItem(msgspec.Struct, gc=False):
+    """Row of the GET /api/documents listing. Same JSON shape as DocumentResponse,
+    but the flags are always set, so they are plain bool/int instead of Optional.
+    id holds the raw DB value; msgspec writes it as a string itself."""
+    id: uuid.UUID
+    title: Optional[str]
+    storageKey: str
+    sizeBytes: Optional[int]
+    mime: Optional[str]
+    status: str
+    createdAt: str
+    lastViewedPage: Optional[int]
+    isShared: bool
+    hasActiveShare: bool
+    questionsCount: int
+
+class UpdateProgressRequest(BaseModel):
+    page: int
+
+# Chat-related Pydantic models
+class CreateThreadRequest(BaseModel):
+    title: Optional[str] = None
+
+class ThreadListItem(msgspec.Struct, gc=False):
+    """Row of the GET /api/documents/{id}/chat/threads listing, same JSON shape as ThreadResponse"""
+    id: uuid.UUID
+    title: str
+    createdAt: str
+    updatedAt: str
+
+class ThreadResponse(BaseModel):
+    id: str
+    title: str
+    createdAt: str
+    updatedAt: str
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
+    @classmethod
+    def from_orm_fast(cls, thread: "ChatThread") -> "ThreadResponse":
+        """Build from a trusted ORM row without running validation"""
+        return cls.model_construct(
+            id=str(thread.id),
+            title=thread.title,
+            createdAt=thread.created_at.isoformat(),
+            updatedAt=thread.updated_at.isoformat()
+        )
+
+class CreateMessageRequest(BaseModel):
+    content: str
+    pageContext: Optional[int] = Field(None, alias="pageContext")
+    contextType: Optional[Literal['page', 'chapter', 'none']] = Field(None, alias="contextType")
+    chapterId: Optional[str] = Field(None, alias="chapterId")
+    
+    model_config = ConfigDict(populate_by_name=True)
+
+class MessageResponse(JSONResponseModel):
+    id: uuid.UUID
+    role: str
+    content: str
+    pageContext: Optional[int] = None
+    contextType: Optional[Literal['page', 'chapter', 'none']] = None
+    chapterId: Optional[uuid.UUID] = None
+    createdAt: IsoDatetime
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
+    @classmethod
+    def from_orm_fast(cls, msg: "ChatMessage") -> "MessageResponse":
+        """Build from a trusted ORM row without running validation"""
+        # Ids and timestamps stay raw; the serializer formats them
+        return cls.model_construct(
+            id=msg.id,
+            role=msg.role,
+            content=msg.content,
+            pageContext=msg.page_context,
+            contextType=msg.context_type or "page",
+            chapterId=msg.chapter_id,
+            createdAt=msg.created_at
+        )
+
+class ThreadWithMessagesResponse(JSONResponseModel):
+    id: uuid.UUID
+    title: str
+    createdAt: IsoDatetime
+    updatedAt: IsoDatetime
+    messages: List[MessageResponse]
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+# Page questions related models
+class PageQuestionResponse(BaseModel):
+    id: uuid.UUID
+    threadId: uuid.UUID
+    threadTitle: str
+    content: str
+    answer: str | None = None  # First assistant response to this question
+    createdAt: IsoDatetime
+    userId: str  # ID of the user who asked the question
+    isOwn: bool  # Whether this question belongs to the current user
+    canOpenThread: bool  # Whether the thread can be opened (only for own questions)
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
+    @classmethod
+    def from_row(cls, row: Any, user_id: str, id_cache: Optional[Dict[Any, str]] = None) -> "PageQuestionResponse":
+        """Build from a flat result row (id, content, created_at, thread_id, thread_title,
+        thread_user_id, answer)"""
+        question_user_id = uuid_str(row.thread_user_id, id_cache)
+        is_own = question_user_id == user_id
+        return cls.model_construct(
+            id=row.id,
+            threadId=row.thread_id,
+            threadTitle=row.thread_title,
+            content=row.content,
+            answer=row.answer,
+            createdAt=row.created_at,
+            userId=question_user_id,
+            isOwn=is_own,
+            canOpenThread=is_own
+        )
+
+class PageQuestionsResponse(JSONResponseModel):
+    pageNumber: int
+    totalQuestions: int
+    questions: List[PageQuestionResponse]
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class AllDocumentQuestionsResponse(JSONResponseModel):
+    documentId: str
+    lastModified: str  # ISO timestamp of the most recent question/answer
+    pages: List[PageQuestionsResponse]  # Questions grouped by page
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class DocumentQuestionsMetadataResponse(BaseModel):
+    documentId: str
+    lastModified: str  # ISO timestamp of the most recent question/answer
+    totalQuestions: int
+    pagesWithQuestions: List[int]  # List of page numbers that have questions
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+# Document structure related models
+class StructureItem(msgspec.Struct, gc=False):
+    """Flat outline entry passed from PDF extraction to the repository"""
+    id: str
+    title: str
+    level: int
+    pageFrom: int
+    pageTo: Optional[int]
+    parentId: Optional[str]
+    orderIndex: int
+
+class DocumentStructureItem(BaseModel):
+    id: str
+    title: str
+    level: int
+    pageFrom: int
+    pageTo: Optional[int]
+    parentId: Optional[str]
+    orderIndex: int
+    children: Optional[List['DocumentStructureItem']] = []
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    
+    @classmethod
+    def from_orm_fast(cls, item: "DocumentStructure", id_cache: Optional[Dict[Any, str]] = None) -> "DocumentStructureItem":
+        """Build from a trusted ORM row (or a result row with the same columns) without running
+        validation. Children are attached by the caller."""
+        return cls.model_construct(
+            id=uuid_str(item.id, id_cache),
+            title=item.title,
+            level=item.level,
+            pageFrom=item.page_from,
+            pageTo=item.page_to,
+            parentId=uuid_str(item.parent_id, id_cache),
+            orderIndex=item.order_index,
+            children=[]
+        )
+
+class DocumentStructureResponse(JSONResponseModel):
+    documentId: str
+    items: List[DocumentStructureItem]
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class ExtractStructureRequest(BaseModel):
+    force: bool = False
+
+class ReindexStructureResponse(BaseModel):
+    reindexed: List[str]
+    failed: List[str]
+
+# User plan and usage related models
+class UserPlanResponse(BaseModel):
+    id: str
+    userId: str
+    planType: str
+    status: str
+    startedAt: str
+    expiresAt: Optional[str] = None
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class PlanLimitsResponse(BaseModel):
+    planType: str
+    maxStorageBytes: int
+    maxFiles: Optional[int] = None
+    maxSingleFileBytes: int
+    maxTokensPerMonth: int
+    maxQuestionsPerMonth: int
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class UserUsageResponse(BaseModel):
+    userId: str
+    planId: str
+    planType: str
+    periodStart: str
+    periodEnd: str
+    storageBytesUsed: int
+    filesCount: int
+    tokensUsed: int
+    questionsCount: int
+    limits: PlanLimitsResponse
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class SetUserPlanRequest(BaseModel):
+    planType: str = Field(..., pattern="^(beta|base|plus)$")
+    
+    model_config = ConfigDict(populate_by_name=True)
+
+# Document sharing related models
+class ShareDocumentRequest(BaseModel):
+    expiresAt: Optional[str] = None  # ISO datetime string
+    
+    model_config = ConfigDict(populate_by_name=True)
+
+class ShareDocumentResponse(BaseModel):
+    shareToken: str
+    shareUrl: str  # Full URL to access the shared document
+    createdAt: str
+    expiresAt: Optional[str] = None
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+class ShareStatusResponse(BaseModel):
+    hasActiveShare: bool
+    shareToken: Optional[str] = None
+    shareUrl: Optional[str] = None
+    createdAt: Optional[str] = None
+    revokedAt: Optional[str] = None
+    expiresAt: Optional[str] = None
+    
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+# Resolve the self-referencing children annotation once at import time
+DocumentStructureItem.model_rebuild()
@@ -0,0 +1,5 @@
+-- Cache the PDF page count on documents so chat prompts get the real page total
+ALTER TABLE documents
+  ADD COLUMN IF NOT EXISTS page_count INTEGER;
+
+COMMENT ON COLUMN documents.page_count IS 'Number of pages in the PDF, filled in when the document is first parsed.';
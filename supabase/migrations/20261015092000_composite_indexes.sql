@@ -0,0 +1,11 @@
+-- Composite indexes matching the hot chat lookups
+-- (document_structure, document_shares and user_usage already have matching indexes from 0008/0009/0011)
+
+-- Messages of a thread in chronological order
+CREATE INDEX IF NOT EXISTS idx_chat_messages_thread_created ON chat_messages(thread_id, created_at);
+
+-- Questions asked on a page, joined through the thread
+CREATE INDEX IF NOT EXISTS idx_chat_messages_thread_page ON chat_messages(thread_id, page_context);
+
+-- A user's threads for a document, most recently updated first
+CREATE INDEX IF NOT EXISTS idx_chat_threads_document_user_updated ON chat_threads(document_id, user_id, updated_at);
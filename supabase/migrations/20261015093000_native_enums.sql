@@ -0,0 +1,60 @@
+-- Store small fixed value sets as native enums (4 bytes per value) instead of TEXT + CHECK.
+-- The CHECK constraints become redundant once the column type enforces the set.
+
+CREATE TYPE message_role AS ENUM ('user', 'assistant');
+CREATE TYPE message_context_type AS ENUM ('page', 'chapter', 'none');
+CREATE TYPE plan_type AS ENUM ('beta', 'base', 'plus');
+CREATE TYPE plan_status AS ENUM ('active', 'trial', 'expired');
+
+-- chat_messages
+ALTER TABLE chat_messages
+  DROP CONSTRAINT IF EXISTS chat_messages_role_check,
+  DROP CONSTRAINT IF EXISTS chat_messages_context_type_check;
+
+ALTER TABLE chat_messages
+  ALTER COLUMN context_type DROP DEFAULT;
+
+ALTER TABLE chat_messages
+  ALTER COLUMN role TYPE message_role USING role::message_role,
+  ALTER COLUMN context_type TYPE message_context_type USING context_type::message_context_type;
+
+ALTER TABLE chat_messages
+  ALTER COLUMN context_type SET DEFAULT 'page';
+
+-- plan_limits / user_plans
+ALTER TABLE plan_limits
+  DROP CONSTRAINT IF EXISTS plan_limits_plan_type_check;
+
+ALTER TABLE plan_limits
+  ALTER COLUMN plan_type TYPE plan_type USING plan_type::plan_type;
+
+ALTER TABLE user_plans
+  DROP CONSTRAINT IF EXISTS user_plans_plan_type_check,
+  DROP CONSTRAINT IF EXISTS user_plans_status_check;
+
+ALTER TABLE user_plans
+  ALTER COLUMN status DROP DEFAULT;
+
+ALTER TABLE user_plans
+  ALTER COLUMN plan_type TYPE plan_type USING plan_type::plan_type,
+  ALTER COLUMN status TYPE plan_status USING status::plan_status;
+
+ALTER TABLE user_plans
+  ALTER COLUMN status SET DEFAULT 'active';
+
+-- initialize_user_plan_for_existing_users() (0009) selects DISTINCT untyped literals, which
+-- resolve to text; text does not cast implicitly to an enum, so type them explicitly
+CREATE OR REPLACE FUNCTION initialize_user_plan_for_existing_users()
+RETURNS void AS $$
+BEGIN
+  -- Insert beta plans for users who don't have a plan yet
+  INSERT INTO user_plans (user_id, plan_type, status, started_at)
+  SELECT DISTINCT owner_id, 'beta'::plan_type, 'active'::plan_status, NOW()
+  FROM documents
+  WHERE owner_id IS NOT NULL
+    AND NOT EXISTS (
+      SELECT 1 FROM user_plans WHERE user_plans.user_id = documents.owner_id
+    )
+  ON CONFLICT DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
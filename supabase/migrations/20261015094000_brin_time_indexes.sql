@@ -0,0 +1,11 @@
+-- BRIN indexes for time-range scans on append-only tables.
+-- Rows arrive in time order, so a block-range summary is enough and costs almost nothing to maintain.
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_created_brin
+  ON chat_messages USING brin (created_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS idx_document_share_access_accessed_brin
+  ON document_share_access USING brin (accessed_at) WITH (pages_per_range = 32);
+
+CREATE INDEX IF NOT EXISTS idx_user_usage_period_start_brin
+  ON user_usage USING brin (period_start) WITH (pages_per_range = 32);
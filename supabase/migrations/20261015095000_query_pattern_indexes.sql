@@ -0,0 +1,17 @@
+-- Indexes shaped after the page-question and chapter lookups
+-- (documents(owner_id, created_at desc) already exists as documents_owner_created_idx,
+--  chat_threads(document_id, user_id, updated_at) since 20261015092000)
+
+-- Questions on a page, newest first; only user messages are ever listed as questions
+CREATE INDEX IF NOT EXISTS idx_chat_messages_thread_page_questions
+  ON chat_messages(thread_id, page_context, created_at DESC)
+  WHERE role = 'user';
+
+-- First assistant answer after a question in the same thread
+CREATE INDEX IF NOT EXISTS idx_chat_messages_thread_answers
+  ON chat_messages(thread_id, created_at)
+  WHERE role = 'assistant';
+
+-- Chapter containing a page, filtered by level
+CREATE INDEX IF NOT EXISTS idx_document_structure_document_level_page
+  ON document_structure(document_id, level, page_from);
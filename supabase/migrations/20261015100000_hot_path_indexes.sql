@@ -0,0 +1,13 @@
+-- Indexes for lookups that had none
+-- (chat_messages(thread_id, created_at), chat_threads(document_id, user_id, updated_at),
+--  documents(owner_id, created_at desc) and the active document_shares index already exist)
+
+-- Current plan: latest active plan of a user
+CREATE INDEX IF NOT EXISTS idx_user_plans_user_active
+  ON user_plans(user_id, started_at DESC)
+  WHERE status = 'active';
+
+-- Outline reuse across uploads of the same file; most rows predate checksums
+CREATE INDEX IF NOT EXISTS idx_documents_checksum
+  ON documents(checksum_sha256)
+  WHERE checksum_sha256 IS NOT NULL;
@@ -0,0 +1,11 @@
+-- Active share lookup: newest non-revoked share of a document.
+-- The old partial index keyed on revoked_at, which is always NULL inside it; keying on
+-- created_at lets get_active_document_share read the newest row without a sort.
+DROP INDEX IF EXISTS idx_document_shares_active;
+CREATE INDEX IF NOT EXISTS idx_document_shares_active
+  ON document_shares(document_id, created_at DESC)
+  WHERE revoked_at IS NULL;
+
+-- Duplicates of the indexes behind UNIQUE(share_token) and UNIQUE(share_id, user_id)
+DROP INDEX IF EXISTS idx_document_shares_token;
+DROP INDEX IF EXISTS idx_document_share_access_share;
@@ -0,0 +1,12 @@
+-- Outline reuse keys on checksum_sha256, which clients can set to anything at upload.
+-- Track whether the server computed the checksum itself, and only reuse outlines from
+-- documents it verified, and only within the same owner.
+ALTER TABLE documents
+  ADD COLUMN IF NOT EXISTS checksum_verified BOOLEAN NOT NULL DEFAULT false;
+
+COMMENT ON COLUMN documents.checksum_verified IS 'True when checksum_sha256 was computed by the server from the stored file, not taken from the client.';
+
+DROP INDEX IF EXISTS idx_documents_checksum;
+CREATE INDEX IF NOT EXISTS idx_documents_checksum
+  ON documents(owner_id, checksum_sha256)
+  WHERE checksum_verified;